@@ -26,14 +26,16 @@
 
 import argparse
 import babel
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 import os
-from os.path import abspath, basename, dirname, isdir, join
-import polib
+from os.path import abspath, basename, dirname, join
 import re
 from subprocess import run
 import sys
+from types import MappingProxyType
 
 
 SCRIPT_NAME = basename(__file__)
@@ -63,6 +65,17 @@ RENAMED_LANGUAGES = {
     "id": "in",
 }
 
+# These patterns are used once per string in every catalog, so compile them in advance.
+BRACE_FIELD_RE = re.compile(r"(\{(\w+)?\})")
+PERCENT_FIELD_RE = re.compile(r"(%(?:(\d+)\$)?.*?[a-zA-Z])")
+EXCLUDED_RE = re.compile(r"^\W*$")
+PLACEHOLDER_RE = re.compile(r"%\S+")
+SQUASH_RE = re.compile(r"\W+", re.ASCII)
+INVALID_CHAR_RE = re.compile(r"\W", re.ASCII)
+ID_START_RE = re.compile(r"^[a-zA-Z_]")
+NPLURALS_RE = re.compile(r"nplurals=(\d+);")
+PO_ESCAPE_RE = re.compile(r'\\(\\|n|t|r|v|b|f|")')
+
 
 catalog_errors = 0
 
@@ -74,7 +87,7 @@ class CatalogError(Exception):
 
 
 def main():
-    global args
+    global args, catalog_errors
     args = parse_args()
     if not args.no_download:
         log("Running make_locale")
@@ -83,69 +96,93 @@ def main():
     locale_dir = join(EC_ROOT, "electroncash/locale")
     src_strings = read_catalog(join(locale_dir, "messages.pot"), "en", "US")
 
+    lang_regions = [entry.name for entry in os.scandir(locale_dir)
+                    if entry.is_dir() and entry.name != '__pycache__']
     lang_strings = defaultdict(list)
-    for lang_region in [name for name in os.listdir(locale_dir)
-                        if isdir(join(locale_dir, name)) and name != '__pycache__']:
-        lang, region = lang_region.split("_")
-        catalog = read_catalog(join(locale_dir, lang_region, "LC_MESSAGES", "electron-cash.po"),
-                               lang, region)
-        lang_strings[lang].append((region, catalog))
+    with ProcessPoolExecutor(initializer=init_worker, initargs=(args,)) as executor:
+        for lang, region, catalog, errors in executor.map(read_lang_catalog,
+                                                          [locale_dir] * len(lang_regions),
+                                                          lang_regions):
+            if catalog is not None:
+                # The worker returns copies of the strings, so they must be interned again.
+                catalog = {sys.intern(msgid): tgt for msgid, tgt in catalog.items()}
+            lang_strings[lang].append((region, catalog))
+            catalog_errors += errors
 
     if catalog_errors:
         sys.exit(1)
 
     log(f"Writing to {args.out}")
     ids = make_ids(src_strings)
-    write_xml(args.out, "", src_strings, ids)
+    timestamp = datetime.utcnow().isoformat()
+    tasks = [("", src_strings)]
     for lang, region_strings in lang_strings.items():
         region_strings.sort(key=region_order, reverse=True)
         for i, (region, strings) in enumerate(region_strings):
-            write_xml(args.out, lang if i == 0 else "{}-r{}".format(lang, region),
-                      strings, ids)
+            tasks.append((lang if i == 0 else "{}-r{}".format(lang, region), strings))
 
+    # The files are independent of each other, so write them concurrently.
+    with ThreadPoolExecutor() as executor:
+        futures = [executor.submit(write_xml, args.out, res_suffix, strings, ids, timestamp)
+                   for res_suffix, strings in tasks]
+        for future in futures:
+            future.result()  # Propagate any exception.
+
+
+def init_worker(main_args):
+    global args
+    args = main_args
 
-def read_catalog(filename, lang, region):
-    lang_region = f"{lang}_{region}"
 
+# Runs in a worker process, so errors are counted separately and returned to the caller.
+def read_lang_catalog(locale_dir, lang_region):
+    errors_before = catalog_errors
+    lang, _, region = lang_region.partition("_")
+    catalog = read_catalog(join(locale_dir, lang_region, "LC_MESSAGES", "electron-cash.po"),
+                           lang, region)
+    return lang, region, catalog, catalog_errors - errors_before
+
+
+def read_catalog(filename, lang, region):
     try:
         is_pot = filename.endswith(".pot")
-        f = polib.pofile(filename)
-        pf = f.metadata.get("Plural-Forms")
+        if args.use_polib:
+            import polib
+            f = polib.pofile(filename)
+            metadata, entries = f.metadata, f
+        else:
+            metadata, entries = read_po(filename)
+        pf = metadata.get("Plural-Forms")
         if pf is None:
             quantities = None
         elif is_pot:
             quantities = ["one", "other"]
         else:
-            match = re.search(r"nplurals=(\d+);", pf)
+            match = NPLURALS_RE.search(pf)
             if not match:
                 raise CatalogError("Failed to parse Plural-Forms")
             nplurals = int(match.group(1))
 
-            try:
-                locale = babel.Locale(lang_region)
-            except babel.UnknownLocaleError:
-                locale = babel.Locale(lang)
-
-            quantities = sorted(locale.plural_form.tags | {"other"},
-                                key=["zero", "one", "two", "few", "many", "other"].index)
+            quantities = get_quantities(lang, region)
             if len(quantities) != nplurals:
                 raise CatalogError(f"Plural-Forms says {nplurals=}, but Babel has "
-                                   f"{len(quantities)} plural tags for this language {quantities}")
+                                   f"{len(quantities)} plural tags for this language {list(quantities)}")
     except CatalogError as e:
         log(f"{filename}: {e}", file=sys.stderr)
         return None
 
     catalog = {}
-    for entry in f:
+    for entry in entries:
         try:
-            msgid = entry.msgid
+            # The same msgids occur in every catalog, so share a single copy of each one.
+            msgid = sys.intern(entry.msgid)
             if is_excluded(msgid):
                 continue
 
             if entry.msgid_plural:
                 # Get field indices from msgid_plural, because sometimes msgid just contains a
                 # singular word with no field.
-                indices = get_indices(entry.msgid_plural)
+                indices_src = entry.msgid_plural
 
                 # Only include the string if it has a complete set of plural translations,
                 # otherwise some numbers would cause it to appear blank.
@@ -156,67 +193,164 @@ def read_catalog(filename, lang, region):
 
                 if quantities is None:
                     raise CatalogError("msgid {msgid!r} has plurals, but file has no Plural-Forms")
-                catalog[msgid] = {quantities[i]: fix_format(s, indices)
+                catalog[msgid] = {quantities[i]: fix_format(s, indices_src)
                                   for i, s in msgstr_plural.items()}
             else:
-                indices = get_indices(msgid)
+                indices_src = msgid
                 msgstr = msgid if is_pot else entry.msgstr
                 if not msgstr:
                     continue
-                catalog[msgid] = fix_format(msgstr, indices)
+                catalog[msgid] = fix_format(msgstr, indices_src)
         except CatalogError as e:
             log(f"{filename}:{entry.linenum}: {e}", file=sys.stderr)
 
     return catalog
 
 
-# Takes a source string in {} or % format, and returns a dict mapping its field keywords and
+PoEntry = namedtuple("PoEntry", ["msgid", "msgid_plural", "msgstr", "msgstr_plural", "linenum"])
+
+PO_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "v": "\v", "b": "\b", "f": "\f"}
+
+
+# A minimal .po file reader which only extracts the fields used by this script. polib also
+# parses comments, flags and occurrences, which makes it several times slower. Returns a tuple
+# of (metadata, entries) with the same meaning as polib's POFile.metadata and POFile entries,
+# including obsolete entries.
+def read_po(filename):
+    metadata = {}
+    entries = []
+    fields = {}
+    key = None
+    linenum = None
+
+    def add_entry():
+        msgstr_plural = {int(k[len("msgstr["):-1]): v for k, v in fields.items()
+                         if k.startswith("msgstr[")}
+        entry = PoEntry(fields["msgid"], fields.get("msgid_plural", ""),
+                        fields.get("msgstr", ""), msgstr_plural, linenum)
+        if entry.msgid == "" and not (entries or metadata):
+            for line in entry.msgstr.split("\n"):
+                name, colon, value = line.partition(":")
+                if colon:
+                    metadata[name.strip()] = value.strip()
+        else:
+            entries.append(entry)
+
+    with open(filename, encoding="utf-8-sig") as f:
+        for line_index, line in enumerate(f, 1):
+            line = line.strip()
+            if line.startswith("#~"):
+                if line.startswith("#~|"):
+                    continue
+                line = line[2:].lstrip()  # Obsolete entry
+            if not line:
+                continue
+
+            if line.startswith('"'):
+                if key is None:
+                    raise CatalogError(f"line {line_index}: unexpected continuation line")
+                fields[key] += unescape_po(line)
+                continue
+
+            keyword, _, value = line.partition(" ")
+            if line.startswith("#") or keyword in ["msgctxt", "msgid"]:
+                # Start of a new entry.
+                if any(k.startswith("msgstr") for k in fields):
+                    add_entry()
+                    fields = {}
+                    linenum = None
+                if linenum is None:
+                    linenum = line_index
+            if line.startswith("#"):
+                key = None
+                continue
+
+            if not (keyword in ["msgctxt", "msgid", "msgid_plural", "msgstr"] or
+                    keyword.startswith("msgstr[")):
+                raise CatalogError(f"line {line_index}: syntax error")
+            key = keyword
+            fields[key] = unescape_po(value.strip())
+
+    if "msgid" in fields:
+        add_entry()
+    return metadata, entries
+
+
+# Converts a quoted .po string to a Python string.
+def unescape_po(s):
+    return PO_ESCAPE_RE.sub(lambda m: PO_ESCAPES.get(m.group(1), m.group(1)), s[1:-1])
+
+
+# Returns a tuple of the Android plural quantities used by the given locale, in the order
+# expected by gettext. Constructing a babel.Locale is relatively slow, so the result is cached.
+@lru_cache(maxsize=None)
+def get_quantities(lang, region):
+    try:
+        locale = babel.Locale(f"{lang}_{region}")
+    except babel.UnknownLocaleError:
+        locale = babel.Locale(lang)
+
+    return tuple(sorted(locale.plural_form.tags | {"other"},
+                        key=["zero", "one", "two", "few", "many", "other"].index))
+
+
+# Takes a source string in {} or % format, and returns a mapping from its field keywords and
 # indices (explicit or implicit) to % field indices to use in the output.
+#
+# The same strings recur across many catalogs, so the result is cached, and is read-only.
+@lru_cache(maxsize=None)
 def get_indices(s):
-    indices = {}
-
     # {} field indices are assigned in the order each field first appears in the string.
     matches = get_brace_fields(s)
     if matches:
-        for _, index in matches:
-            if index not in indices:
-                indices[index] = len(indices) + 1
+        indices = {index: i for i, index in
+                   enumerate(dict.fromkeys(index for _, index in matches), 1)}
 
     # % field indices are taken directly from the string, so they may leave gaps.
     else:
         matches = get_percent_fields(s)
-        for _, index in matches:
-            indices[index] = int(index)
+        if not matches:
+            return NO_INDICES  # Most strings have no fields.
+        indices = {index: int(index) for _, index in matches}
 
-    return indices
+    return MappingProxyType(indices)
+
+
+NO_INDICES = MappingProxyType({})
 
 
 # Takes a string in {} or % format, and converts it to Java-compatible % format, taking into
-# account the given field indices generated by get_indices. Strings which are already in %
-# format will be checked for errors and returned unchanged.
+# account the field indices which get_indices generates from `indices_src`. Strings which are
+# already in % format will be checked for errors and returned unchanged.
 #
 # A string having fewer fields than the msgid isn't necessarily an error, e.g. some
 # translations omit a numeric field and use the equivalent of "a" or "one" instead. But if a
 # string references a field that isn't in the msgid, that usually causes a crash (e.g. #2358).
-def fix_format(s, indices):
+#
+# Both arguments are strings, so the result can be cached. Errors are not cached, so they will
+# still be reported for every catalog they occur in.
+@lru_cache(maxsize=None)
+def fix_format(s, indices_src):
+    indices = get_indices(indices_src)
     INDEX_ERROR = "string {!r} uses field {!r}, which isn't in the msgid"
 
     matches = get_brace_fields(s)
     if matches:
-        # The string uses {} format, so any % signs cannot be fields, and should be escaped.
-        result = s.replace("%", "%%")
-
+        replacements = []
         for field, index in matches:
             try:
                 index_out = indices[index]
             except KeyError:
                 if index not in args.ignore_unknown_keywords:
                     raise CatalogError(INDEX_ERROR.format(s, index))
+                replacements.append(field)
             else:
-                result = result.replace(field,
-                                        "%s" if (len(indices) == 1) else f"%{index_out}$s",
-                                        1)
-        return result
+                replacements.append("%s" if (len(indices) == 1) else f"%{index_out}$s")
+
+        # The string uses {} format, so any % signs cannot be fields, and should be escaped.
+        # The fields are then replaced in a single pass, in the same order as `matches`.
+        replacements = iter(replacements)
+        return BRACE_FIELD_RE.sub(lambda match: next(replacements), s.replace("%", "%%"))
 
     else:
         matches = get_percent_fields(s)
@@ -237,7 +371,9 @@ def fix_format(s, indices):
 #   * The field keyword or index as a string, with implicit fields numbered from 0.
 def get_brace_fields(s):
     # TODO: handle more complex syntax like "{x:.3f}".
-    matches = re.findall(r"(\{(\w+)?\})", s)
+    if "{" not in s:
+        return []  # Much faster than running the regex.
+    matches = BRACE_FIELD_RE.findall(s)
     return fill_implicit(matches, 0)
 
 
@@ -245,7 +381,11 @@ def get_brace_fields(s):
 #   * The entire field, including the %.
 #   * The field index as a string, with implicit fields numbered from 1.
 def get_percent_fields(s):
-    matches = re.findall(r"(%(?:(\d+)\$)?.*?[a-zA-Z])", s.replace("%%", ""))
+    if "%" not in s:
+        return []  # Much faster than running the regex.
+    if "%%" in s:
+        s = s.replace("%%", "")
+    matches = PERCENT_FIELD_RE.findall(s)
     return fill_implicit(matches, 1)
 
 
@@ -283,15 +423,23 @@ def parse_args():
                     help="Keywords which can appear in a string without being in the msgid")
     ap.add_argument("--out", metavar="DIR", type=abspath, required=True,
                     help="Output resources directory")
+    ap.add_argument("--use-polib", action="store_true",
+                    help="Read catalogs with polib rather than the built-in reader")
     return ap.parse_args()
 
 
 def is_excluded(src_str):
-    return bool(re.search(r"^\W*$", src_str))  # Empty or only punctuation.
+    # Most strings start with a letter, which is enough to show that they aren't excluded.
+    if src_str[:1].isalnum():
+        return False
+    return bool(EXCLUDED_RE.search(src_str))  # Empty or only punctuation.
 
 
 # Returns a dict {s: id} where each `s` is a string in `strings`, and `id` is a unique
 # Java/Kotlin identifier generated from it.
+#
+# Each attempt only processes the strings which the previous attempts couldn't resolve, and
+# avoids the IDs they've already assigned, so the attempts must run in sequence.
 def make_ids(strings):
     ids_out = {}
     for id_options in [dict(lower=True, squash=True),
@@ -315,40 +463,52 @@ def make_ids(strings):
 
 def make_ids_inner(ids_in, ids_out):
     max_words = 2
-    existing_ids = list(ids_out.values())
-    prev_counts = None
-    while ids_in:
-        counts = Counter(existing_ids)
-        counts.update([shorten_id(id, max_words) for id in ids_in.values()])
-        if counts == prev_counts:
-            raise DuplicateStringError()
+    short_ids = {s: shorten_id(id, max_words) for s, id in ids_in.items()}
+    counts = Counter(ids_out.values())
+    counts.update(short_ids.values())
 
-        strings_done = []
-        for s, id in ids_in.items():
-            short_id = shorten_id(id, max_words)
-            if counts[short_id] == 1:
-                ids_out[s] = short_id
-                strings_done.append(s)
+    # The counts are updated incrementally as strings are resolved and their IDs get longer.
+    # Only IDs which are currently shortened can get longer when max_words is increased.
+    growing = [s for s, id in ids_in.items() if short_ids[s] != id]
+    while ids_in:
+        strings_done = [s for s, short_id in short_ids.items() if counts[short_id] == 1]
         for s in strings_done:
+            short_id = short_ids.pop(s)
+            counts[short_id] -= 1
+            ids_out[s] = short_id
             del ids_in[s]
 
-        prev_counts = counts
         max_words += 1
+        changed = False
+        still_growing = []
+        for s in growing:
+            if s in ids_in:
+                old_id, new_id = short_ids[s], shorten_id(ids_in[s], max_words)
+                if new_id != old_id:
+                    counts[old_id] -= 1
+                    counts[new_id] += 1
+                    short_ids[s] = new_id
+                    changed = True
+                if new_id != ids_in[s]:
+                    still_growing.append(s)
+        growing = still_growing
+
+        if not (strings_done or changed):
+            raise DuplicateStringError()
 
 
 # We still need to preserve empty words to avoid duplicate IDs. But we don't count them against
 # the word limit, otherwise we end up with IDs like "__1" or "_", the last of which isn't even
 # legal in Java 9.
+@lru_cache(maxsize=None)
 def shorten_id(id, max_words):
-    result = []
     num_words = 0
-    for word in id:
-        result.append(word)
+    for i, word in enumerate(id):
         if word:
             num_words += 1
-        if num_words == max_words:
-            break
-    return tuple(result)
+            if num_words == max_words:
+                return id[:i + 1]
+    return id
 
 
 class DuplicateStringError(Exception):
@@ -356,26 +516,28 @@ class DuplicateStringError(Exception):
 
 
 # Returns an identifier generated from every word in the given string.
+@lru_cache(maxsize=None)
 def str_to_id(s, *, lower, squash):
     s_original = s
-    s = s.replace("'", "")  # Combine contractions.
+    if "'" in s:
+        s = s.replace("'", "")  # Combine contractions.
     if lower:
         s = s.lower()
 
     if squash:
-        s = re.sub(r"%\S+", "", s)  # Remove placeholders.
-        pattern = r"\W+"
+        s = PLACEHOLDER_RE.sub("", s)  # Remove placeholders.
+        pattern = SQUASH_RE
         lstrip = "0123456789_"
         rstrip = "_"
     else:
-        pattern = r"\W"
+        pattern = INVALID_CHAR_RE
         lstrip = "0123456789"
         rstrip = ""
-    id = (re.sub(pattern, "_", s, flags=re.ASCII)  # Remove invalid characters.
+    id = (pattern.sub("_", s)  # Remove invalid characters.
           .lstrip(lstrip)
           .rstrip(rstrip))
 
-    if not id or not re.search(r"^[a-zA-Z_]", id):
+    if not id or not ID_START_RE.search(id):
         if squash:
             return str_to_id(s_original, lower=lower, squash=False)
         else:
@@ -386,60 +548,57 @@ def str_to_id(s, *, lower, squash):
     return id
 
 
-def write_xml(res_dir, res_suffix, strings, ids):
+XML_HEADER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+              '<!-- Generated by ' + SCRIPT_NAME + ' at {timestamp} -->\n'
+              '<!-- DO NOT EDIT this file directly. See "Strings" in android/README.md. -->\n'
+              '<resources>\n')
+
+def write_xml(res_dir, res_suffix, strings, ids, timestamp):
     res_suffix = RENAMED_LANGUAGES.get(res_suffix, res_suffix)
     dir_name = "values" + ("-" + res_suffix if res_suffix else "")
     base_name = "strings.xml"
-    log("{}/{}: ".format(dir_name, base_name), end="")
     abs_dir_name = join(res_dir, dir_name)
     os.makedirs(abs_dir_name, exist_ok=True)
 
-    timestamp = datetime.utcnow().isoformat()
     output = sorted(((ids[src_str], tgt)
                      for src_str, tgt in strings.items()
                      if src_str in ids),  # Crowdin strings may not be in our local source.
                     key=lambda x: case_insensitive(x[0]))
+
+    # Build the whole file in memory and write it with a single call.
+    lines = [XML_HEADER.format(timestamp=timestamp)]
+    for id, tgt in output:
+        if isinstance(tgt, dict):
+            lines.append(f'    <plurals name="{id}">\n')
+            for quantity, s in tgt.items():
+                lines.append(f'        <item quantity="{quantity}">{str_for_xml(s)}</item>\n')
+            lines.append('    </plurals>\n')
+        else:
+            lines.append(f'    <string name="{id}">{str_for_xml(tgt)}</string>\n')
+    lines.append('</resources>\n')
     with open(join(abs_dir_name, base_name), "w", encoding="UTF-8") as f:
-        print('<?xml version="1.0" encoding="utf-8"?>', file=f)
-        print('<!-- Generated by {} at {} -->'.format(SCRIPT_NAME, timestamp), file=f)
-        print('<!-- DO NOT EDIT this file directly. See "Strings" in android/README.md. -->',
-              file=f)
-        print('<resources>', file=f)
-        for id, tgt in output:
-            if isinstance(tgt, dict):
-                print('    <plurals name="{}">'.format(id), file=f)
-                for quantity, s in tgt.items():
-                    print('        <item quantity="{}">{}</item>'
-                          .format(quantity, str_for_xml(s)), file=f)
-                print('    </plurals>', file=f)
-            else:
-                print('    <string name="{}">{}</string>'.format(id, str_for_xml(tgt)), file=f)
-        print('</resources>', file=f)
+        f.write("".join(lines))
 
-    log("{} items".format(len(output)))
+    log(f"{dir_name}/{base_name}: {len(output)} items")
 
 
-XML_REPLACEMENTS = [
+XML_REPLACEMENTS = str.maketrans({
     # Generic XML syntax
-    ("&", "&amp;"),
-    ("<", "&lt;"),
-    (">", "&gt;"),
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
 
     # Android-specific syntax
     # (https://developer.android.com/guide/topics/resources/string-resource#escaping_quotes)
-    (re.compile(r"^([@?])"), r"\\\1"),
-    ("'", r"\'"),
-    ('"', r'\"'),
-    ("\n", r"\n"),
-]
+    "'": r"\'",
+    '"': r'\"',
+    "\n": r"\n",
+})
 
 def str_for_xml(s):
-    for old, new in XML_REPLACEMENTS:
-        if isinstance(old, str):
-            s = s.replace(old, new)
-        else:
-            s = re.sub(old, new, s)
-    return s
+    if s[:1] in ("@", "?"):  # Only special at the start of the string.
+        s = "\\" + s
+    return s.translate(XML_REPLACEMENTS)
 
 
 def log(*args, **kwargs):
@@ -28,7 +28,7 @@ import os
 import re
 import traceback
 from collections import namedtuple
-from typing import List, Dict, Generator
+from typing import List, Dict, FrozenSet, Generator
 from . import dnssec
 from . import cashacct
 from . import lns
@@ -63,6 +63,7 @@ class Contacts(util.PrintError):
 
     def load(self):
         self.data = self._load_from_dict_like_object(self.storage)
+        self._names_by_type = dict()  # type -> frozenset of names, see names_by_type(); cleared whenever self.data changes
 
     @staticmethod
     def _load_from_dict_like_object(storage) -> List[Contact]:
@@ -313,6 +314,7 @@ class Contacts(util.PrintError):
         try:
             index = self.data.index(old)
             self.data[index] = new
+            self._names_by_type.clear()
             self.save()
             return True
         except ValueError:
@@ -341,6 +343,7 @@ class Contacts(util.PrintError):
         if unique and contact in self.data:
             return False  # unique add requested, abort because already exists
         self.data.append(contact)
+        self._names_by_type.clear()
         if save:
             self.save()
         return True
@@ -351,6 +354,7 @@ class Contacts(util.PrintError):
         contact exist, only the first one found is removed. '''
         try:
             self.data.remove(contact)
+            self._names_by_type.clear()
             if save:
                 self.save()
             return True
@@ -367,6 +371,15 @@ class Contacts(util.PrintError):
             self.save()
         return ct
 
+    def names_by_type(self, type: str) -> FrozenSet[str]:
+        ''' Returns the set of names of all the contacts of the given type.
+        The set is cached until the contact list next changes, so repeated
+        calls don't walk the whole contact list. '''
+        names = self._names_by_type.get(type)
+        if names is None:
+            names = self._names_by_type[type] = frozenset(c.name for c in self.data if c.type == type)
+        return names
+
     def find(self, *, address: str = None, name: str = None, type: str = None,
              case_sensitive: bool = True) -> Generator[Contact, None, None]:
         ''' Returns a generator. Searches the contact list for contacts matching
@@ -26,6 +26,7 @@
 '''
 LNS related classes and functions.
 '''
+import itertools
 import json
 import requests
 import threading
@@ -34,6 +35,7 @@ import random
 import time
 from collections import defaultdict, namedtuple
 from typing import List, Optional, Tuple, Union
+from urllib3.util.retry import Retry
 
 from electroncash.simple_config import get_config
 from . import util
@@ -42,11 +44,17 @@ from .transaction import get_address_from_output_script
 try:
     from web3 import Web3
     from web3.contract import Contract
+    import eth_abi
     available = False
 except ImportError:
     available = False
     Web3 = type(None)
     Contract = type(None)
+    eth_abi = None
+try:
+    import orjson  # optional, faster JSON encoding and decoding of subgraph requests
+except ImportError:
+    orjson = None
 
 # 'lns:' URI scheme. Not used yet. Used by Crescent Cash and Electron Cash and
 # other wallets in the future.
@@ -73,6 +81,7 @@ class Info(namedtuple("Info", "name, address, registrationDate, expiryDate")):
 
 debug = False  # network debug setting. Set to True when developing to see more verbose information about network operations.
 timeout = 25.0  # default timeout used in various network functions, in seconds.
+page_concurrency = 4  # number of result pages fetched at once when a lookup returns more than one page.
 
 abi = [
     {
@@ -141,29 +150,89 @@ rpc_servers = [
     "http://localhost:8545"
 ]
 
+COIN_TYPE_BCH = 145
+GETADDRS_SELECTOR = bytes.fromhex('344b9a1b')  # first 4 bytes of keccak256(b'getAddrs(string[],uint256)')
+
 graph_servers = [
     "https://graph.bch.domains/subgraphs/name/graphprotocol/ens",
     "https://graph.bch.domains/subgraphs/name/graphprotocol/ens-amber"
 ]
 
-w3: Web3 = None
-contract: Contract = None
+# Shared by all lookups, so that connections to the graph servers are kept
+# alive and reused rather than set up again for every request.
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=16,
+                                                        max_retries=Retry(total=2, backoff_factor=0.2)))
+# The page responses are very repetitive JSON, so ask for them compressed.
+graph_headers = {
+    'Content-Type': 'application/json',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# Runs the lookups started by lookup_asynch and lookup_asynch_all, so that
+# threads are reused rather than created for every lookup. Its threads are
+# daemon threads, so that lookups still running don't hold up quitting.
+lookup_executor = util.DaemonThreadPoolExecutor(max_workers=16, thread_name_prefix="LNS lookup")
+# Fetches the further result pages of lookups. This must not be lookup_executor,
+# since lookups running on it wait for their pages, and with all of its threads
+# busy waiting the pages would never be fetched.
+page_executor = util.DaemonThreadPoolExecutor(max_workers=2 * page_concurrency, thread_name_prefix="LNS lookup page")
+
+contracts = dict()  # dict of rpc server url -> Contract; guarded with contracts_lock
+contracts_lock = threading.Lock()
 
 
 def get_lns_contract() -> Contract:
-    global w3
-    global contract
     rpc_server: str = get_config().get('lns_rpc_server', rpc_servers[0])
-    if not w3 or w3.provider.endpoint_uri != rpc_server:
-        w3 = Web3(Web3.HTTPProvider(rpc_server))
-        '''
-        contract to look up multiple LNS addresses given a list of names and coin type
-        see also https://github.com/bchdomains/reverse-records/blob/442862bf42bfaaf98c9511c2a0907ee612dbde13/contracts/ReverseRecords.sol#L73
-        '''
-        contract = w3.eth.contract(address="0x0efB8EE0F6d6ba04F26101683F062d7Ca6F58A40", abi=abi)
+    contract = contracts.get(rpc_server)
+    if contract is None:
+        with contracts_lock:
+            contract = contracts.get(rpc_server)
+            if contract is None:
+                w3 = Web3(Web3.HTTPProvider(rpc_server, request_kwargs={'timeout': timeout}, session=session))
+                '''
+                contract to look up multiple LNS addresses given a list of names and coin type
+                see also https://github.com/bchdomains/reverse-records/blob/442862bf42bfaaf98c9511c2a0907ee612dbde13/contracts/ReverseRecords.sol#L73
+                '''
+                contract = w3.eth.contract(address="0x0efB8EE0F6d6ba04F26101683F062d7Ca6F58A40", abi=abi)
+                contracts[rpc_server] = contract
     return contract
 
 
+def encode_getaddrs(names: List[str]) -> str:
+    """ Returns the eth_call data for the contract's getAddrs function. """
+    return '0x' + (GETADDRS_SELECTOR + eth_abi.encode(['string[]', 'uint256'], [names, COIN_TYPE_BCH])).hex()
+
+
+def get_addrs(contract: Contract, names_by_page: List[List[str]]) -> List[List[bytes]]:
+    """ Calls the contract's getAddrs function once for each list of names,
+    and returns a list of the results. Where web3 supports it, all the calls
+    are sent to the RPC server in a single JSON-RPC batch request. """
+    w3 = contract.w3
+    calls = [{'to': contract.address, 'data': encode_getaddrs(names)} for names in names_by_page]
+    # The calls are made directly through the provider, which skips the
+    # request validation that web3 would otherwise do for every call.
+    if len(calls) > 1 and hasattr(w3.provider, 'make_batch_request'):
+        responses = w3.provider.make_batch_request([('eth_call', [call, 'latest']) for call in calls])
+        if not isinstance(responses, list):
+            raise RuntimeError('Unexpected response', responses)
+    else:
+        responses = [w3.provider.make_request('eth_call', [call, 'latest']) for call in calls]
+    ret = []
+    for response in responses:
+        result = response.get('result')
+        if not isinstance(result, str) or not result.startswith('0x'):
+            raise RuntimeError('Unexpected response', response)
+        ret.append(eth_abi.decode(['bytes[]'], bytes.fromhex(result[2:]))[0])
+    return ret
+
+
+def strip_suffix(name: str) -> str:
+    """ Returns name without its '.bch' suffix, if any. """
+    return name[:-len('.bch')] if name.endswith('.bch') else name
+
+
 def validate(name):
     if not name or not len(name):
         raise ArgumentError("Please pass a non-empty 'name' to lookup")
@@ -195,43 +264,61 @@ def lookup(server, name: Union[str, List[str]], timeout=timeout, exc=[], debug=d
     now = int(time.time())
     batch = 425 # number which fits into gas limit
     skip = 0
-    def get_json(skip):
-        if isinstance(name, list) or isinstance(name, set):
-            names = [str.split(n.strip(), '.bch')[0] for n in name]
-            return {"query": f'{{registrations(first:{batch},skip:{skip},where:{{labelName_in:{json.dumps(names)},expiryDate_gt:"{now}"}}){{labelName,registrationDate,expiryDate}}}}'}
-        else:
-            lookupName = str.split(name.strip(), '.bch')[0]
-            return {"query": f'{{registrations(first:{batch},skip:{skip},where:{{labelName_contains:"{lookupName}",expiryDate_gt:"{now}"}}){{labelName,registrationDate,expiryDate}}}}'}
+    # Only `skip` changes from page to page, so build the rest of the query once.
+    is_multi = isinstance(name, (list, set))
+    if is_multi:
+        names = [strip_suffix(n.strip()) for n in name]
+        where = f'labelName_in:{json.dumps(names)}'
+    else:
+        lookupName = strip_suffix(name.strip())
+        where = f'labelName_contains:"{lookupName}"'
+    # Ask for one more than a page, so that a full page tells whether another
+    # page follows without having to fetch a trailing empty one.
+    query_head = f'{{registrations(first:{batch + 1},skip:'
+    query_tail = f',where:{{{where},expiryDate_gt:"{now}"}}){{labelName,registrationDate,expiryDate}}}}'
+
+    def get_page(skip):
+        query = {"query": query_head + str(skip) + query_tail}
+        body = orjson.dumps(query) if orjson else json.dumps(query).encode('utf-8')
+        # The graph servers don't redirect, so don't follow redirects either.
+        r = session.post(url, data=body, headers=graph_headers, allow_redirects=False, timeout=timeout)  # will raise requests.exceptions.Timeout on timeout
+        r.raise_for_status()
+        d = orjson.loads(r.content) if orjson else r.json()
+        if not isinstance(d, dict) or not d.get('data'):
+            raise RuntimeError('Unexpected response', r.text)
+        res = d['data']
+        registrations = res['registrations']
+        if not isinstance(registrations, list):
+            raise RuntimeError('Bad response')
+        return registrations[:batch], len(registrations) > batch
 
     try:
         ret = []
-        while True:
-            r = requests.post(url, json=get_json(skip), allow_redirects=True, timeout=timeout)  # will raise requests.exceptions.Timeout on timeout
-            r.raise_for_status()
-            d = r.json()
-            if not isinstance(d, dict) or not d.get('data'):
-                raise RuntimeError('Unexpected response', r.text)
-            res = d['data']
-            registrations = res['registrations']
-            if not isinstance(registrations, list):
-                raise RuntimeError('Bad response')
-
-            if len(registrations):
-                names = [d['labelName'] + '.bch' for d in registrations]
-                COIN_TYPE_BCH = 145
-                addrs = contract.functions.getAddrs(names, COIN_TYPE_BCH).call()
-                filtered = [dict(reg, addr=addr) for (reg, addr) in zip(registrations,addrs) if addr != b'']
-
-                for reg in filtered:
-                    ret.append(Info(reg['labelName'] + '.bch',
-                                    get_address_from_output_script(reg['addr'])[1],
-                                    int(reg['registrationDate']),
-                                    int(reg['expiryDate'])))
-
-            if len(registrations) == batch:
-                skip += batch
-            else:
-                break
+        registrations, more = get_page(skip)
+        pages = [registrations]
+        if more:
+            # More results are available. The pages don't depend on each other,
+            # so fetch them concurrently, `page_concurrency` pages at a time,
+            # until the last page is seen.
+            while more:
+                skips = [skip + batch * (i + 1) for i in range(page_concurrency)]
+                skip = skips[-1]
+                for registrations, more in page_executor.map(get_page, skips):
+                    pages.append(registrations)
+                    if not more:
+                        break
+
+        pages = [registrations for registrations in pages if len(registrations)]
+        addrs_by_page = get_addrs(contract, [[d['labelName'] + '.bch' for d in registrations]
+                                             for registrations in pages])
+        for registrations, addrs in zip(pages, addrs_by_page):
+            filtered = [dict(reg, addr=addr) for (reg, addr) in zip(registrations,addrs) if addr != b'']
+
+            for reg in filtered:
+                ret.append(Info(reg['labelName'] + '.bch',
+                                get_address_from_output_script(reg['addr'])[1],
+                                int(reg['registrationDate']),
+                                int(reg['expiryDate'])))
 
         return ret
     except Exception as e:
@@ -242,8 +329,8 @@ def lookup(server, name: Union[str, List[str]], timeout=timeout, exc=[], debug=d
 
 
 def lookup_asynch(server, success_cb, error_cb=None, name=None, timeout=timeout, debug=debug):
-    """ Like lookup() above, but spawns a thread and does its lookup
-    asynchronously.
+    """ Like lookup() above, but does its lookup asynchronously in a thread
+    from lookup_executor.
 
     success_cb - will be called on successful completion with a single arg:
                  a List[Info].
@@ -253,7 +340,7 @@ def lookup_asynch(server, success_cb, error_cb=None, name=None, timeout=timeout,
     In either case one of the two callbacks will be called. It's ok for
     success_cb and error_cb to be the same function (in which case it should
     inspect the arg passed to it). Note that the callbacks are called in the
-    context of the spawned thread, (So e.g. Qt GUI code using this function
+    context of the worker thread, (So e.g. Qt GUI code using this function
     should not modify the GUI directly from the callbacks but instead should
     emit a Qt signal from within the callbacks to be delivered to the main
     thread as usual.) """
@@ -271,10 +358,8 @@ def lookup_asynch(server, success_cb, error_cb=None, name=None, timeout=timeout,
             called = True
         if not called:
             # this should never happen
-            util.print_error("WARNING: no callback called for ", threading.current_thread().name)
-    t = threading.Thread(name=f"LNS lookup_asynch: {server} ({name},{timeout})",
-                         target=thread_func, daemon=True)
-    t.start()
+            util.print_error(f"WARNING: no callback called for LNS lookup_asynch: {server} ({name},{timeout})")
+    lookup_executor.submit(thread_func)
 
 
 def lookup_asynch_all(success_cb, error_cb=None, name=None, timeout=timeout, debug=debug):
@@ -346,13 +431,25 @@ def lookup_asynch_all(success_cb, error_cb=None, name=None, timeout=timeout, deb
                         util.print_error(f"do_lookup_all_staggered: returning "
                                          f"early on server {i} of {len(my_servers)} after {(time.time()-t0)*1e3} msec")
                     return
-    t = threading.Thread(daemon=True, target=do_lookup_all_staggered)
-    t.start()
+    if N == 1:
+        # There's nothing to stagger, so don't start a thread just to wait on
+        # a single lookup.
+        server = my_servers[0]
+        lookup_asynch(server,
+                      success_cb=lambda res: on_succ(res, server),
+                      error_cb=lambda exc: on_err(exc, server),
+                      name=name, timeout=timeout, debug=debug)
+        return
+    lookup_executor.submit(do_lookup_all_staggered)
 
 
 class LNS(util.PrintError):
     """ Class implementing LNS subsystem such as verification, etc. """
 
+    # How often (in seconds) at most newly verified names cause the wallet to be written. In between, they are
+    # only put into wallet storage, and get written along with the rest of the wallet.
+    write_interval = 10.0
+
     def __init__(self, wallet):
         assert wallet, "LNS cannot be instantiated without a wallet"
         self.wallet = wallet
@@ -361,11 +458,15 @@ class LNS(util.PrintError):
         self._init_data()
 
         # below is used by method self.verify_name_asynch:
-        self._names_in_flight = defaultdict(list)  # number (eg 100-based-modified height) -> List[tuple(success_cb, error_cb)]; guarded with lock
+        self._names_in_flight = defaultdict(list)  # name key -> List[tuple(success_cb, error_cb)]; guarded with _inflight_lock
+        self._inflight_lock = threading.Lock()  # separate from self.lock so that lookup bookkeeping doesn't contend with readers of the verified data
+
+        self._last_write = None  # time.monotonic() of our last wallet write, if any; guarded with _write_lock
+        self._write_lock = threading.Lock()
 
     def _init_data(self):
-        self.v_by_addr = defaultdict(set)  # dict of addr -> set of Info
-        self.v_by_name = defaultdict(set)  # dict of lowercased name -> set of Info
+        self.v_by_addr = dict()  # dict of addr -> tuple of Info
+        self.v_by_name = dict()  # dict of lowercased name -> Info
 
     def diagnostic_name(self):
         return f'{self.wallet.diagnostic_name()}.{__class__.__name__}'
@@ -431,21 +532,19 @@ class LNS(util.PrintError):
         If inv is True, then domain specifies addresses NOT to include
         in the results (i.e. every verified LNS Name we know about not in
         domain be returned). """
-        if domain is None:
-            domain = self.v_by_addr if not inv else set()
-        ret = []
-        seen = set()
         with self.lock:
-            if inv:
-                domain = set(self.v_by_addr) - set(domain)
-            for addr in domain:
-                infos = self.v_by_addr.get(addr, set())
-                for info in infos:
-                    if info and info not in seen:
-                        seen.add(info)
-                        ret.append(info)
-
-        return ret
+            # Keep the addresses in a predictable order, since callers display
+            # the results: that of domain, or else the order they were verified in.
+            if domain is None:
+                addrs = self.v_by_addr.keys()
+            elif inv:
+                excluded = set(domain)
+                addrs = [addr for addr in self.v_by_addr if addr not in excluded]
+            else:
+                addrs = [addr for addr in dict.fromkeys(domain) if addr in self.v_by_addr]
+            # Each Info is only stored under its own address, and domain's
+            # duplicates were dropped above, so there are no duplicates to remove.
+            return list(itertools.chain.from_iterable(self.v_by_addr[addr] for addr in addrs))
 
     def get_wallet_lns_names(self) -> List[Info]:
         """ Convenience method, returns all the verified lns names we
@@ -461,15 +560,44 @@ class LNS(util.PrintError):
         """ Note: loading should happen before threads are started, so no lock
         is needed."""
         self._init_data()
+        dd = self.wallet.storage.get('lns_data', {})
+        now = time.time()
+        for info_dict in dd.get('verified', []):
+            info = Info.from_dict(info_dict)
+            if info.expiryDate > now:
+                # Expired names will be looked up again from the network.
+                self._add_info(info)
 
     def save(self, write=False):
         """
         FYI, current data model is:
 
-        self.v_by_addr = defaultdict(set) # dict of addr -> set of txid
-        self.v_by_name = defaultdict(set) # dict of lowercased name -> set of txid
+        self.v_by_addr = dict() # dict of addr -> tuple of Info
+        self.v_by_name = dict() # dict of lowercased name -> Info
         """
-        pass
+        with self.lock:
+            verified = [info.to_dict() for info in self.v_by_name.values()]
+
+        self.wallet.storage.put('lns_data', {'verified': verified})
+
+        if write:
+            self.wallet.storage.write()
+
+    def _maybe_write(self):
+        """ Writes the wallet, unless we already did so within the last write_interval seconds. """
+        now = time.monotonic()
+        with self._write_lock:
+            if self._last_write is not None and now - self._last_write < self.write_interval:
+                return
+            self._last_write = now
+        self.wallet.storage.write()
+
+    def _add_info(self, info: Info):
+        """ Adds a verified Info to the data model. Call with the lock held. """
+        self.v_by_name[info.name.lower()] = info
+        infos = self.v_by_addr.get(info.address, ())
+        if info not in infos:
+            self.v_by_addr[info.address] = infos + (info,)
 
     def get_verified(self, lns_name) -> Info:
         """ Returns the Info object for lns_name of the form: satoshi.bch
@@ -482,18 +610,10 @@ class LNS(util.PrintError):
     def find_verified(self, name: str) -> List[Info]:
         """ Returns a list of Info objects for verified LNS Names matching
         lowercased name. """
-        ret = []
         with self.lock:
-            name = name.lower()
-            s = self.v_by_name.get(name, set())
-            for info in s:
-                if info:
-                    if info.name.lower() != name:
-                        self.print_error(f"find: FIXME -- v_by_name has inconsistent data for name {name} != {info.name}")
-                        continue
-                    ret.append(info)
+            info = self.v_by_name.get(name.lower())
 
-        return ret
+        return [info] if info else []
 
     def verify_name_asynch(self, name=None, success_cb=None, error_cb=None, timeout=timeout, debug=debug):
         """ Tries all servers. Calls success_cb with the verified List[Info]
@@ -502,9 +622,26 @@ class LNS(util.PrintError):
         to call 1 of the 2 callbacks in either case.  Callbacks are optional
         and won't be called if specified as None. """
         exc=[]
-        key = json.dumps(list(name))
-        def on_error(exc):
+        if isinstance(name, str):
+            # A single name is a substring search, so it must not share a key
+            # with a list of that one name, which is an exact lookup.
+            key = name.strip().lower()
+        else:
+            key = frozenset(n.strip().lower() for n in name)
             with self.lock:
+                infos = [self.v_by_name.get(n) for n in key]
+            now = time.time()
+            if all(info and info.expiryDate > now for info in infos):
+                # Every name was already verified and hasn't expired, so skip the network.
+                if debug:
+                    self.print_error(f"verify_name_asynch: #{key} already verified")
+                if success_cb:
+                    t = threading.Timer(0, success_cb, [infos])
+                    t.daemon = True
+                    t.start()
+                return
+        def on_error(exc):
+            with self._inflight_lock:
                 l = self._names_in_flight.pop(key, [])
             ct = 0
             for success_cb, error_cb in l:
@@ -517,10 +654,11 @@ class LNS(util.PrintError):
             if isinstance(pb, List):
                 with self.lock:
                     for item in pb:
-                        self.v_by_name[item.name].add(item)
-                        self.v_by_addr[item.address].add(item)
-                    self.save(True)
+                        self._add_info(item)
+                with self._inflight_lock:
                     l = self._names_in_flight.pop(key, [])
+                self.save()
+                self._maybe_write()
                 ct = 0
                 for success_cb, error_cb in l:
                     if success_cb:
@@ -529,7 +667,7 @@ class LNS(util.PrintError):
                 if debug: self.print_error(f"verify_name_asynch: called {ct} success callbacks for #{key}")
             else:
                 on_error(exc[-1])
-        with self.lock:
+        with self._inflight_lock:
             l = self._names_in_flight[key]
             l.append((success_cb, error_cb))
             if len(l) == 1:
@@ -10,19 +10,24 @@
 This implements the functionality for RPA (Reusable Payment Address) aka Paycodes
 '''
 
+from ctypes import byref, c_size_t, create_string_buffer
 from decimal import Decimal as PyDecimal
+import hashlib
+import hmac
 import time
 
 from . import addr
 from .. import bitcoin
+from .. import secp256k1
 from .. import transaction
-from ..address import Address, Base58
+from ..address import Address
 from ..bitcoin import *  # COIN, TYPE_ADDRESS, sha256
 from ..plugins import run_hook
-from ..transaction import Transaction, OPReturn
+from ..transaction import OPReturn
 from ..keystore import KeyStore
-from ..util import print_msg
+from ..util import print_error, print_msg
 from .. import networks
+from .. import schnorr
 
 
 def _satoshis(amount):
@@ -82,29 +87,55 @@ def _mktx(wallet, config, outputs, fee=None, change_addr=None, domain=None, noch
     return tx
 
 
-def _calculate_paycode_shared_secret(private_key, public_key, outpoint):
+def _ecdh_x_libsecp256k1(private_key, public_key):
+    """Returns the x coordinate of public_key * private_key as 32 bytes,
+    computed by libsecp256k1.  Returns None if libsecp256k1 is not available
+    or can't do the multiplication, in which case the caller should fall back
+    to the pure python implementation."""
+    lib = secp256k1.secp256k1
+    if not lib:
+        return None
+    pubkey = create_string_buffer(64)
+    if not lib.secp256k1_ec_pubkey_parse(lib.ctx, pubkey, public_key, len(public_key)):
+        return None
+    if not lib.secp256k1_ec_pubkey_tweak_mul(lib.ctx, pubkey, private_key.to_bytes(32, byteorder="big")):
+        return None
+    product = create_string_buffer(33)
+    product_size = c_size_t(33)
+    lib.secp256k1_ec_pubkey_serialize(lib.ctx, product, byref(product_size), pubkey, secp256k1.SECP256K1_EC_COMPRESSED)
+    return product.raw[1:33]
+
+
+def _calculate_paycode_shared_secret(private_key, public_key, outpoint, ecdh_cache=None):
     """private key is expected to be an integer.
     public_key is expected to be bytes.
-    outpoint is expected to be a string.
+    outpoint is expected to be the outpoint string (the prevout hash in hex
+    followed by the prevout index in decimal) encoded as ascii bytes.  A str
+    is accepted too.
+    ecdh_cache is an optional dict, which should only ever be used with the
+    same private_key.  It remembers the ECDH hash for each public_key, so that
+    several outpoints spent by the same key cost a single multiplication.
     returns the paycode shared secret as bytes"""
 
-    from ..bitcoin import Point
-    from ..bitcoin import curve_secp256k1 as curve
-
-    # Public key is expected to be compressed.  Change into a point object.
-    pubkey_point = bitcoin.ser_to_point(public_key)
-    ecdsa_point = Point(curve, pubkey_point.x(), pubkey_point.y())
-
-    # Multiply the public and private points together
-    ecdh_product = ecdsa_point * private_key
-    ecdh_x = int(ecdh_product.x())
-    ecdh_x_bytes = ecdh_x.to_bytes(33, byteorder="big")
-
-    # Get the hash of the product
-    sha_ecdh_x_bytes = sha256(ecdh_x_bytes)
-    sha_ecdh_x_as_int = int.from_bytes(sha_ecdh_x_bytes, byteorder="big")
-
-    # Hash the outpoint string
+    sha_ecdh_x_as_int = ecdh_cache.get(public_key) if ecdh_cache is not None else None
+    if sha_ecdh_x_as_int is None:
+        # Multiply the public and private points together
+        ecdh_x = _ecdh_x_libsecp256k1(private_key, public_key)
+        if ecdh_x is not None:
+            ecdh_x_bytes = b'\x00' + ecdh_x
+        else:
+            # Public key is expected to be compressed.  Change into a point object.
+            ecdh_product = bitcoin.ser_to_point(public_key) * private_key
+            ecdh_x_bytes = int(ecdh_product.x()).to_bytes(33, byteorder="big")
+
+        # Get the hash of the product
+        sha_ecdh_x_bytes = sha256(ecdh_x_bytes)
+        sha_ecdh_x_as_int = int.from_bytes(sha_ecdh_x_bytes, byteorder="big")
+        if ecdh_cache is not None:
+            ecdh_cache[public_key] = sha_ecdh_x_as_int
+
+    # Hash the outpoint string.  Note that the paycode protocol hashes this
+    # text form, not the 36 byte serialized outpoint.
     hash_of_outpoint = sha256(outpoint)
     hash_of_outpoint_as_int = int.from_bytes(hash_of_outpoint, byteorder="big")
 
@@ -112,30 +143,52 @@ def _calculate_paycode_shared_secret(private_key, public_key, outpoint):
     grand_sum = sha_ecdh_x_as_int + hash_of_outpoint_as_int
 
     # Hash the final result
-    nbytes = (len("%x" % grand_sum) + 1) // 2
+    nbytes = max(1, (grand_sum.bit_length() + 7) // 8)
     grand_sum_bytes = grand_sum.to_bytes(nbytes, byteorder="big")
     shared_secret = sha256(grand_sum_bytes)
 
     return shared_secret
 
 
+def _CKD_pub_libsecp256k1(parent_pubkey, secret, compressed):
+    """Same derivation as bitcoin.CKD_pub(parent_pubkey, secret, 0), but the
+    point addition is done by libsecp256k1, which also serializes the child
+    pubkey compressed or uncompressed as requested.  Returns None if
+    libsecp256k1 is not available or can't derive the key."""
+    lib = secp256k1.secp256k1
+    if not lib:
+        return None
+    I = hmac.new(secret, parent_pubkey + bytes(4), hashlib.sha512).digest()
+    pubkey = create_string_buffer(64)
+    if not lib.secp256k1_ec_pubkey_parse(lib.ctx, pubkey, parent_pubkey, len(parent_pubkey)):
+        return None
+    if not lib.secp256k1_ec_pubkey_tweak_add(lib.ctx, pubkey, I[0:32]):
+        return None
+    size = 33 if compressed else 65
+    child = create_string_buffer(size)
+    child_size = c_size_t(size)
+    flags = secp256k1.SECP256K1_EC_COMPRESSED if compressed else secp256k1.SECP256K1_EC_UNCOMPRESSED
+    lib.secp256k1_ec_pubkey_serialize(lib.ctx, child, byref(child_size), pubkey, flags)
+    return child.raw
+
+
 def _generate_address_from_pubkey_and_secret(parent_pubkey, secret):
     """parent_pubkey and secret are expected to be bytes
     This function generates a receiving address based on CKD."""
 
-    new_pubkey = bitcoin.CKD_pub(parent_pubkey, secret, 0)[0]
     use_uncompressed = True
+    new_pubkey = _CKD_pub_libsecp256k1(parent_pubkey, secret, compressed=not use_uncompressed)
+    if new_pubkey is not None:
+        return Address.from_pubkey(new_pubkey)
+
+    new_pubkey = bitcoin.CKD_pub(parent_pubkey, secret, 0)[0]
 
     # Currently, just uses compressed keys, but if this ever changes to
     # require uncompressed points:
     if use_uncompressed:
         pubkey_point = bitcoin.ser_to_point(new_pubkey)
-        x_coord = hex(pubkey_point.x())[2:].zfill(64)
-        y_coord = hex(pubkey_point.y())[2:].zfill(64)
-        uncompressed = "04" + \
-            hex(pubkey_point.x())[2:].zfill(64) + \
-            hex(pubkey_point.y())[2:].zfill(64)
-        new_pubkey = bytes.fromhex(uncompressed)
+        new_pubkey = (b'\x04' + int(pubkey_point.x()).to_bytes(32, byteorder="big")
+                      + int(pubkey_point.y()).to_bytes(32, byteorder="big"))
     return Address.from_pubkey(new_pubkey)
 
 
@@ -196,17 +249,16 @@ def generate_transaction_from_paycode(wallet, config, amount, rpa_paycode=None,
 
     # Decode the paycode
     rprefix, addr_hash = addr.decode(rpa_paycode)
+    addr_hash = bytes(addr_hash)
     paycode_hex = addr_hash.hex().upper()
 
-    # Parse paycode
-    paycode_field_version = paycode_hex[0:2]
-    paycode_field_prefix_size = paycode_hex[2:4]
-    paycode_field_scan_pubkey = paycode_hex[4:70]
-    paycode_field_spend_pubkey = paycode_hex[70:136]
-    paycode_field_expiry = paycode_hex[136:144]
-    paycode_field_checksum = paycode_hex[144: 154]
+    # Parse paycode: version (1 byte), prefix size (1 byte), scan pubkey (33
+    # bytes), spend pubkey (33 bytes) and expiry (4 bytes).
+    paycode_field_prefix_size = addr_hash[1]
+    scanpubkey_bytes = addr_hash[2:35]
+    spendpubkey_bytes = addr_hash[35:68]
 
-    paycode_expiry = int.from_bytes(bytes.fromhex(paycode_field_expiry), byteorder='big', signed=False)
+    paycode_expiry = int.from_bytes(addr_hash[68:72], byteorder='big', signed=False)
     if paycode_expiry != 0:
         one_week_from_now = int(time.time()) + 604800
         if paycode_expiry < one_week_from_now:
@@ -221,14 +273,9 @@ def generate_transaction_from_paycode(wallet, config, amount, rpa_paycode=None,
     grind_nonce = 0
     grinding_version = "1"
 
-    if paycode_field_prefix_size == "04":
-        prefix_chars = 1
-    elif paycode_field_prefix_size == "08":
-        prefix_chars = 2
-    elif paycode_field_prefix_size == "0C":
-        prefix_chars = 3
-    elif paycode_field_prefix_size == "10":
-        prefix_chars = 4
+    # The prefix size is in bits, one hex character per 4 bits.
+    if paycode_field_prefix_size in (0x04, 0x08, 0x0C, 0x10):
+        prefix_chars = paycode_field_prefix_size // 4
     else:
         raise ValueError("Invalid prefix size. Must be 4,8,12, or 16 bits.")
 
@@ -245,45 +292,16 @@ def generate_transaction_from_paycode(wallet, config, amount, rpa_paycode=None,
     # Use the first input (input zero) for our shared secret
     input_zero = tx._inputs[0]
 
-    # Fetch our own private key for the coin
-    bitcoin_addr = input_zero["address"]
-    private_key_wif_format = wallet.export_private_key(bitcoin_addr, password)
-    private_key_int_format = int.from_bytes(
-        Base58.decode_check(private_key_wif_format)[
-            1:33], byteorder="big")
-
-    # Grab the outpoint  (the colon is intentionally ommitted from the string)
-    outpoint_string = str(
-        input_zero["prevout_hash"]) + str(input_zero["prevout_n"])
-
-    # Format the pubkey in preparation to get the shared secret
-    scanpubkey_bytes = bytes.fromhex(paycode_field_scan_pubkey)
-
-    # Calculate shared secret
-    shared_secret = _calculate_paycode_shared_secret(
-        private_key_int_format, scanpubkey_bytes, outpoint_string)
-
-    # Get the real destination for the transaction
-    rpa_destination_address = _generate_address_from_pubkey_and_secret(bytes.fromhex(paycode_field_spend_pubkey),
-                                                                       shared_secret).to_string(
-        Address.FMT_CASHADDR)
-
-    # Swap the dummy destination for the real destination
-    tx.rpa_paycode_swap_dummy_for_destination(
-        rpa_dummy_address, rpa_destination_address)
-
-    # Now we need to sign the transaction after the outputs are known
-    grind_string = paycode_field_scan_pubkey[2:prefix_chars + 2].upper()
-    wallet.sign_transaction(tx, password)
-
     # Setup wallet and keystore in preparation for signature grinding
     my_keystore = wallet.get_keystore()
 
     # We assume one signature per input, for now...
     assert len(input_zero["signatures"]) == 1
-    input_zero["signatures"] = [None]
 
-    # Keypair logic from transaction module
+    # Keypair logic from transaction module.  The keystore is decrypted just
+    # this once: the same keypairs give us the private key of input zero for
+    # the shared secret, the grinding signatures, and the signatures of any
+    # other inputs.
     keypairs = my_keystore.get_tx_derivations(tx)
     for k, v in keypairs.items():
         keypairs[k] = my_keystore.get_private_key(v, password)
@@ -300,10 +318,35 @@ def generate_transaction_from_paycode(wallet, config, amount, rpa_paycode=None,
             continue
         sec, compressed = keypairs.get(_pubkey)
 
+    # Our own private key for the coin
+    private_key_int_format = int.from_bytes(sec, byteorder="big")
+
+    # Grab the outpoint  (the colon is intentionally ommitted from the string)
+    outpoint_bytes = "{}{}".format(input_zero["prevout_hash"], input_zero["prevout_n"]).encode('ascii')
+
+    # Calculate shared secret
+    shared_secret = _calculate_paycode_shared_secret(
+        private_key_int_format, scanpubkey_bytes, outpoint_bytes)
+
+    # Get the real destination for the transaction
+    rpa_destination_address = _generate_address_from_pubkey_and_secret(spendpubkey_bytes,
+                                                                       shared_secret).to_string(
+        Address.FMT_CASHADDR)
+
+    # Swap the dummy destination for the real destination
+    tx.rpa_paycode_swap_dummy_for_destination(
+        rpa_dummy_address, rpa_destination_address)
+
+    # Now we need to sign the transaction after the outputs are known.  The
+    # grinding loop below produces the signature of input zero; the other
+    # inputs are signed once it is done.
+    grind_string = scanpubkey_bytes[1:].hex()[:prefix_chars].upper()
+
     # Get the keys and preimage ready for signing
     pubkey = public_key_from_private_key(sec, compressed)
     nHashType = 0x00000041  # hardcoded, perhaps should be taken from unsigned input dict
     pre_hash = Hash(bfh(tx.serialize_preimage(0, nHashType, use_cache=False)))
+    input_zero["pubkeys"][0] = pubkey
 
     # While loop for grinding.  Keep grinding until txid prefix matches
     # paycode scanpubkey prefix.
@@ -313,31 +356,72 @@ def generate_transaction_from_paycode(wallet, config, amount, rpa_paycode=None,
     if progress_callback:
         progress_callback(progress_count)
 
+    # Input zero is serialized on the first grind.  After that only its
+    # signature changes, so each grind just splices the new signature into the
+    # serialized bytes instead of building the input script and serializing
+    # the input again.
+    my_serialized_input_bytes = None
+    sig_offset = None
+
+    # The hash of input zero must start with the hex digits in grind_string.
+    # Compare raw bytes rather than hex strings: the whole bytes first, then
+    # the high nibble of the next byte if there is an odd number of digits.
+    grind_prefix_bytes = bytes.fromhex(grind_string[:prefix_chars & ~1])
+    grind_prefix_len = len(grind_prefix_bytes)
+    grind_prefix_nibble = int(grind_string[-1], 16) if prefix_chars & 1 else None
+
+    # Every grinding message starts with paycode_hex, so hash that part once
+    # and only feed the nonce and version into a copy of it on each grind.
+    grinding_message_hash = hashlib.sha256(paycode_hex.encode('utf8'))
+
     while not tx_matches_paycode_prefix:
         if exit_event:
             if exit_event.is_set():
                 break
 
         grind_nonce_string = str(grind_count)
-        grinding_message = paycode_hex + grind_nonce_string + grinding_version
-        ndata = sha256(grinding_message)
-        # Re-sign the transaction input.
-        tx._sign_txin(0, 0, sec, compressed, use_cache=False, ndata=ndata)
+        h = grinding_message_hash.copy()
+        h.update((grind_nonce_string + grinding_version).encode('utf8'))
+        ndata = h.digest()
+        # Re-sign the transaction input.  Only ndata changes from grind to
+        # grind, so sign the preimage hash from above directly rather than via
+        # tx._sign_txin, which rebuilds the preimage and verifies every time.
+        sig = schnorr.sign(sec, pre_hash, ndata=ndata) + bytes((nHashType & 0xff,))
+        input_zero["signatures"][0] = sig.hex()
 
         if progress_callback and progress_count < grind_count // 1000:
             progress_count = grind_count // 1000
             progress_callback(progress_count)
 
-        input_zero = tx._inputs[0]
-        my_serialized_input = tx.serialize_input(input_zero, tx.input_script(input_zero, False, tx._sign_schnorr))
-        my_serialized_input_bytes = bytes.fromhex(my_serialized_input)
-        hashed_input = sha256(sha256(my_serialized_input_bytes)).hex()
-        if hashed_input[0:prefix_chars].upper(
-        ) == paycode_field_scan_pubkey[2:prefix_chars + 2].upper():
+        if my_serialized_input_bytes is None:
+            my_serialized_input = tx.serialize_input(input_zero, tx.input_script(input_zero, False, tx._sign_schnorr))
+            my_serialized_input_bytes = bytearray.fromhex(my_serialized_input)
+            sig_offset = my_serialized_input_bytes.index(sig)
+        else:
+            my_serialized_input_bytes[sig_offset:sig_offset + len(sig)] = sig
+        hashed_input = hashlib.sha256(hashlib.sha256(my_serialized_input_bytes).digest()).digest()
+        if (hashed_input[:grind_prefix_len] == grind_prefix_bytes
+                and (grind_prefix_nibble is None or hashed_input[grind_prefix_len] >> 4 == grind_prefix_nibble)):
             tx_matches_paycode_prefix = True
 
         grind_count += 1
 
+    if not tx_matches_paycode_prefix:
+        # Cancelled through exit_event.  Input zero may not even be signed yet,
+        # and without a matching hash the recipient would never find the
+        # payment, so there is no transaction to return.
+        return None
+
+    # Verify the signature we settled on, which the loop above skipped.
+    reason = []
+    if not tx.verify_signature(bfh(pubkey), sig[:-1], pre_hash, reason=reason):
+        print_error(f"RPA signature verification failed for input#0, reason: {str(reason)}")
+        return 0
+
+    # Sign the remaining inputs.  Their signatures don't depend on the
+    # signature of input zero, which is complete and so is left alone.
+    tx.sign(keypairs)
+
     # Sort the inputs and outputs deterministically
     tx.BIP_LI01_sort()
 
@@ -349,37 +433,46 @@ def generate_transaction_from_paycode(wallet, config, amount, rpa_paycode=None,
     return retval
 
 
-def extract_private_keys_from_transaction(wallet, raw_tx, password=None):
+def extract_private_keys_from_transaction(wallet, raw_tx, password=None, key_cache=None):
+    # key_cache is an optional dict in which our scan and spend private keys are
+    # kept between calls, so that scanning many transactions doesn't decrypt
+    # the keystore for every one of them.
+
     # Initialize return value.  Will return empty list if no private key can be found.
     retval = [] 
 
-    # Deserialize the raw transaction
-    unpacked_tx = Transaction.deserialize(Transaction(raw_tx))
+    # Deserialize the raw transaction.  Only its inputs and outputs are needed,
+    # so parse it directly instead of building a Transaction around it.
+    unpacked_tx = transaction.deserialize(raw_tx)
 
-    # Get a list of output addresses (we will need this for later to check if
+    # Get the set of output addresses (we will need this for later to check if
     # our key matches)
-    output_addresses = []
     outputs = unpacked_tx["outputs"]
-    for i in outputs:
-        if isinstance(i['address'], Address):
-            output_addresses.append(
-                i['address'].to_string(
-                    Address.FMT_CASHADDR))
+    output_addresses = {i['address'] for i in outputs if isinstance(i['address'], Address)}
 
     # Variables for looping
     number_of_inputs = len(unpacked_tx["inputs"])
     input_index = 0
     process_inputs = True
 
+    # Our scan and spend keys are the same for every input.  They are fetched
+    # from the wallet when the first input with a sender pubkey is reached,
+    # since exporting private keys decrypts the keystore.
+    scan_private_key_int_format = None
+    spendpubkey = None
+    spend_private_key_bytes = None
+
+    # Inputs spending coins of the same address share the sender pubkey, and
+    # with it the ECDH part of the shared secret.
+    ecdh_cache = dict()
+
     # Process each input until we find one that creates the shared secret to
     # get a private key for an output
     while process_inputs:
 
         # Grab the outpoint
         single_input = unpacked_tx["inputs"][input_index]
-        prevout_hash = single_input["prevout_hash"]
-        prevout_n = str(single_input["prevout_n"])  # n is int. convert to str.
-        outpoint_string = prevout_hash + prevout_n
+        outpoint_bytes = "{}{}".format(single_input["prevout_hash"], single_input["prevout_n"]).encode('ascii')
 
         # Get the pubkey of the sender from the scriptSig.
         scriptSig = bytes.fromhex(single_input["scriptSig"])
@@ -404,47 +497,42 @@ def extract_private_keys_from_transaction(wallet, raw_tx, password=None):
 
         sender_pubkey = bytes.fromhex(d["pubkeys"][0])
 
-        # We need the private key that corresponds to the scanpubkey.
-        # In this implementation, this is the one that goes with receiving
-        # address 0
-        scanpubkey = wallet.derive_pubkeys(0, 0)
-
-        scan_private_key_wif_format = wallet.export_private_key_from_index(
-            (False, 0), password)
+        if scan_private_key_int_format is None:
+            if key_cache is None:
+                key_cache = dict()
+            if 'scan' not in key_cache:
+                # We need the private key that corresponds to the scanpubkey.
+                # In this implementation, this is the one that goes with receiving
+                # address 0
+                key_cache['scan'] = int.from_bytes(wallet.get_private_key_from_index((False, 0), password)[0],
+                                                   byteorder="big")
+
+                # Get the spendpubkey for our paycode.
+                # In this implementation, simply: receiving address 1.
+                key_cache['spendpubkey'] = wallet.derive_pubkeys(0, 1)
+
+                # Fetch our own private (spend) key out of the wallet.
+                key_cache['spend'] = wallet.get_private_key_from_index((False, 1), password)[0]
+            scan_private_key_int_format = key_cache['scan']
+            spendpubkey = key_cache['spendpubkey']
+            spend_private_key_bytes = key_cache['spend']
 
-        scan_private_key_int_format = int.from_bytes(Base58.decode_check(scan_private_key_wif_format)[1:33],
-                                                     byteorder="big")
         # Calculate shared secret
         shared_secret = _calculate_paycode_shared_secret(
-            scan_private_key_int_format, sender_pubkey, outpoint_string)
-
-        # Get the spendpubkey for our paycode.
-        # In this implementation, simply: receiving address 1.
-        spendpubkey = wallet.derive_pubkeys(0, 1)
+            scan_private_key_int_format, sender_pubkey, outpoint_bytes, ecdh_cache)
 
         # Get the destination address for the transaction
-        destination = _generate_address_from_pubkey_and_secret(bytes.fromhex(spendpubkey), shared_secret).to_string(
-            Address.FMT_CASHADDR)
-
-        # Fetch our own private (spend) key out of the wallet.
-        spendpubkey = wallet.derive_pubkeys(0, 1)
-        spend_private_key_wif_format = wallet.export_private_key_from_index(
-            (False, 1), password)
-        spend_private_key_int_format = int.from_bytes(Base58.decode_check(spend_private_key_wif_format)[1:33],
-                                                      byteorder="big")
-        # Generate the private key for the money being received via paycode
-        privkey = _generate_privkey_from_secret(bytes.fromhex(
-            hex(spend_private_key_int_format)[2:]), shared_secret)
-
-        # Now convert to WIF
-        extendedkey = "80" + privkey
-        extendedkey_bytes = bytes.fromhex(extendedkey)
-        checksum = bitcoin.Hash(extendedkey).hex()[0:8]
-        key_with_checksum = extendedkey + checksum
-        privkey_wif = bitcoin.EncodeBase58Check(extendedkey_bytes)
+        destination = _generate_address_from_pubkey_and_secret(bytes.fromhex(spendpubkey), shared_secret)
 
         # Check the address matches
         if destination in output_addresses:
+            # Generate the private key for the money being received via paycode
+            privkey = _generate_privkey_from_secret(spend_private_key_bytes, shared_secret)
+
+            # Now convert to WIF
+            extendedkey = "80" + privkey
+            extendedkey_bytes = bytes.fromhex(extendedkey)
+            privkey_wif = bitcoin.EncodeBase58Check(extendedkey_bytes)
             retval.append(privkey_wif)
             
         # Increment the input
@@ -41,17 +41,32 @@ class Rpa_manager(ThreadJob):
     External interface: __init__() and add() member functions.
     '''
 
+    # How long (in seconds) each call of rpa_phase_4 may spend processing queued transactions.
+    phase_4_time_budget = 0.05
+
+    # How often (in seconds) at most a bumped rpa_height causes the wallet to be written.
+    flush_interval = 5.0
+
     def __init__(self, wallet, network):
         self.wallet = wallet
         self.network = network
         self.lock = Lock()
         self.rpa_q_rawtx = queue.Queue()
         
-        # self.tx_heights is a dict that stores the height of each tx the rpa_manager encounters.
+        # self.tx_heights is a dict that stores the height of each tx the rpa_manager is waiting to receive.
         self.tx_heights = dict()
         
-        # self.block_requests is a dict that stores the requests made for blocks from the server.
-        self.block_requests = dict()
+        # self.block_requests is a set that stores the heights of the outstanding requests made for blocks from the server.
+        self.block_requests = set()
+
+        # Writing the wallet is expensive, so a bumped rpa_height only marks it dirty, and _maybe_flush()
+        # writes it out every flush_interval seconds at most.
+        self._rpa_height_dirty = False
+        self._last_flush = time.monotonic()
+
+        # Our scan and spend private keys, kept by extract_private_keys_from_transaction so the keystore isn't
+        # decrypted for every scanned transaction.  Cleared when the wallet password changes.
+        self._private_key_cache = dict()
         
 
     def rpa_phase_1_mempool(self):
@@ -111,7 +126,7 @@ class Rpa_manager(ThreadJob):
             if rpa_height not in self.block_requests:
                 requests.append(('blockchain.reusable.get_history', params))
                 self.network.send(requests, self.rpa_phase_2)
-                self.block_requests[rpa_height]=1
+                self.block_requests.add(rpa_height)
         return    
   
         
@@ -130,29 +145,42 @@ class Rpa_manager(ThreadJob):
         if payload is None:
             return
         
-        for i in payload:
-            txid = i['tx_hash']
-            tx_height = i['height'] 
-            self.tx_heights[txid] = tx_height
-            rawtx_request  = []
-            params_tx_get = [txid]
-            rawtx_request.append(('blockchain.transaction.get', params_tx_get))
-            self.network.send(rawtx_request,self.rpa_phase_3)
-         
         # We will also implement a special queue item called "lastblock" which contains the literal strick "lastblock"
-        # instead of a rawtx.  This can pushed on the queue after all other items in the payload are pushed.  The FIFO
-        # structure of the network queue will then process this last, and this module can then update the rpa_height
-        # for the wallet.  This neatly handles all the cases where there are no transactions at certain blockheights,
-        # empty payloads, and so on.  This approach means we aren't looking at the heights of individual transactions.
-        # Instead we're concerned with the height of the entire payload with regards to bumping the wallet height.
+        # instead of a rawtx.  This is pushed on the queue after all other items in the payload are pushed, and this
+        # module can then update the rpa_height for the wallet.  This neatly handles all the cases where there are no
+        # transactions at certain blockheights, empty payloads, and so on.  This approach means we aren't looking at the
+        # heights of individual transactions. Instead we're concerned with the height of the entire payload with regards
+        # to bumping the wallet height.
+        lastblock_tuple = None
 
-        # Put the lastblock item into the queue.  Only for block requests, not mempool.
+        # The lastblock item is only for block requests, not mempool.
         if method == 'blockchain.reusable.get_history':
             # Don't forget to subtract one from the blockheight plus the number of blocks.
             last_block_in_payload = params[0]+params[1]-1
-            # Put a special "last block" item in the queue.  We can do it here rather than using a callback, which happens for normal queue items 
-            raw_tx_and_height_tuple = ("lastblock",last_block_in_payload)
-            self.rpa_q_rawtx.put(raw_tx_and_height_tuple)
+            lastblock_tuple = ("lastblock",last_block_in_payload)
+
+        if not payload:
+            if lastblock_tuple:
+                self.rpa_q_rawtx.put(lastblock_tuple)
+            return
+
+        for i in payload:
+            txid = i['tx_hash']
+            tx_height = i['height'] 
+            self.tx_heights[txid] = tx_height
+
+        # Request all the raw transactions in one go.  The responses still arrive one at a time, so count them down
+        # and put the lastblock item in the queue once the last raw tx of the payload has been queued.
+        remaining = [len(payload)]
+
+        def rpa_phase_3_payload(response):
+            self.rpa_phase_3(response)
+            remaining[0] -= 1
+            if remaining[0] == 0 and lastblock_tuple:
+                self.rpa_q_rawtx.put(lastblock_tuple)
+
+        rawtx_requests = [('blockchain.transaction.get', [i['tx_hash']]) for i in payload]
+        self.network.send(rawtx_requests, rpa_phase_3_payload)
             
         return
              
@@ -166,7 +194,7 @@ class Rpa_manager(ThreadJob):
         raw_tx = response.get('result')
         params = response.get('params') 
         txid = params[0]
-        tx_height = self.tx_heights[txid]
+        tx_height = self.tx_heights.pop(txid, 0)
         raw_tx_and_height_tuple = (raw_tx,tx_height)
         self.rpa_q_rawtx.put(raw_tx_and_height_tuple)
         return
@@ -178,39 +206,49 @@ class Rpa_manager(ThreadJob):
         # for rawtx: "lastblock", which also has a height, and is treated differently.
         # It signals that the payload chunk is completely processed and the rpa_height in the wallet can be bumped.
 
-        #If the queue is empty, exit.
-        if self.rpa_q_rawtx.qsize() == 0:
-            return
-       
+        # Work through as much of the queue as fits in the time budget, rather than one item per run loop tick,
+        # but without holding up the network thread for too long.
+        deadline = time.monotonic() + self.phase_4_time_budget
         lastblock_height = 0
-        if not self.rpa_q_rawtx.empty():
-            rawtx_tuple = self.rpa_q_rawtx.get()
-            rawtx=rawtx_tuple[0]
-            tx_height = rawtx_tuple[1]
-            extracted_private_key = 0
+        while not self.rpa_q_rawtx.empty() and time.monotonic() < deadline:
+            rawtx, tx_height = self.rpa_q_rawtx.get()
             
             if rawtx != "lastblock":
                 password = self.wallet.rpa_pwd
-                # This will be assigned to zero if the private key cannot be extracted (most tx)
-                extracted_private_keys = self.wallet.extract_private_keys_from_transaction(rawtx, password)  
+                # This will be an empty list if no private key can be extracted (most tx)
+                extracted_private_keys = self.wallet.extract_private_keys_from_transaction(rawtx, password, self._private_key_cache)
                 for pk in extracted_private_keys:
                     self.wallet.import_private_key(pk, password)
             else:
-                lastblock_height = tx_height
- 
-            
- 
-        new_height = 0
-        # last block
+                lastblock_height = max(lastblock_height, tx_height)
+
+        # Every item queued before the last "lastblock" seen has been processed, so the rpa_height only needs
+        # to be bumped (and the wallet written) once for the whole batch.
         if lastblock_height > 0:
-            new_height = lastblock_height+1       
-            
-        if new_height > 0:
+            # The requests for blocks up to here are complete, so forget them.
+            self.block_requests = {h for h in self.block_requests if h > lastblock_height}
+            new_height = lastblock_height+1
             self.wallet.storage.put('rpa_height', new_height)
-            self.wallet.storage.write()          
+            self._rpa_height_dirty = True
+            self._maybe_flush()
             
         return
 
+    def _maybe_flush(self, force=False):
+        # Write the wallet if rpa_height changed since the last write, and either enough time has passed or
+        # force is set.
+        if self._rpa_height_dirty and (force or time.monotonic() - self._last_flush >= self.flush_interval):
+            self._rpa_height_dirty = False
+            self._last_flush = time.monotonic()
+            self.wallet.storage.write()
+
+    def clear_private_key_cache(self):
+        self._private_key_cache.clear()
+
+    def stop(self):
+        '''Called when the wallet stops its threads, so that the latest rpa_height is not lost.'''
+        self._maybe_flush(force=True)
+
         
     def run(self):
         '''Called from the network proxy thread main loop.'''
@@ -242,4 +280,5 @@ class Rpa_manager(ThreadJob):
         # Note: only phase 1 and phase 4 are called directly from this run loop.  Phases 2 and 3 are executed as callbacks.
         self.rpa_phase_1()
         self.rpa_phase_4()
+        self._maybe_flush()
         
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -*- mode: python3 -*-
+# Part of the Electron Cash SPV Wallet
+# License: MIT
+'''
+RPA (Reusable Payment Address) tests.
+'''
+import unittest
+
+from .. import bitcoin
+from ..address import Address
+from ..rpa import paycode
+
+
+class _Wallet:
+    ''' Just enough of an RpaWallet for extract_private_keys_from_transaction '''
+
+    def __init__(self, scan_privkey, spend_privkey):
+        self.privkeys = [scan_privkey, spend_privkey]
+
+    def get_private_key_from_index(self, index, password):
+        return self.privkeys[index[1]], True
+
+    def derive_pubkeys(self, c, i):
+        return bitcoin.public_key_from_private_key(self.privkeys[i], True)
+
+
+class TestRpa(unittest.TestCase):
+
+    scan_privkey = bytes.fromhex('6b8f3c5a3c3d2a0dd2cbe2bb1dc1bf34a5dfc8b0e3c3b8e1e6a4aa1e5f0b2f41')
+    sender_privkey = bytes.fromhex('2b1dbb1a77e7e8f0d9f0ce2d4a1f7d2b31a4d7a3c1ff5e0e4ce2b7b6a2cc8d13')
+    prevout_hash = bytes.fromhex('aa' * 16 + 'bb' * 16)
+    prevout_n = 3
+
+    def _make_tx(self, spend_pubkey):
+        ''' Returns a raw tx spending a coin of the sender to the RPA
+        destination for spend_pubkey '''
+        sender_pubkey = bytes.fromhex(bitcoin.public_key_from_private_key(self.sender_privkey, True))
+        scan_pubkey = bytes.fromhex(bitcoin.public_key_from_private_key(self.scan_privkey, True))
+        outpoint = self.prevout_hash[::-1].hex() + str(self.prevout_n)
+        shared_secret = paycode._calculate_paycode_shared_secret(
+            int.from_bytes(self.sender_privkey, 'big'), scan_pubkey, outpoint)
+        destination = paycode._generate_address_from_pubkey_and_secret(spend_pubkey, shared_secret)
+
+        script_sig = bytes([65]) + bytes(64) + bytes([0x41]) + bytes([33]) + sender_pubkey
+        output_script = destination.to_script()
+        raw = (bytes.fromhex('01000000') + bytes([1])
+               + self.prevout_hash + self.prevout_n.to_bytes(4, 'little')
+               + bytes([len(script_sig)]) + script_sig + bytes.fromhex('ffffffff')
+               + bytes([1]) + (10000).to_bytes(8, 'little') + bytes([len(output_script)]) + output_script
+               + bytes(4))
+        return raw.hex(), destination
+
+    def test_extract_private_keys_from_transaction(self):
+        spend_privkeys = [
+            bytes.fromhex('1d2f8e0a5b6c7d8e9fa0b1c2d3e4f5061728394a5b6c7d8e9fa0b1c2d3e4f506'),
+            # int-to-hex of these has an odd number of digits / a leading zero byte
+            bytes.fromhex('0a' + 'bc' * 31),
+            bytes.fromhex('00' + 'cd' * 31),
+        ]
+        for spend_privkey in spend_privkeys:
+            wallet = _Wallet(self.scan_privkey, spend_privkey)
+            raw_tx, destination = self._make_tx(bytes.fromhex(wallet.derive_pubkeys(0, 1)))
+
+            keys = paycode.extract_private_keys_from_transaction(wallet, raw_tx)
+            self.assertEqual(1, len(keys))
+            _txin_type, privkey, compressed = bitcoin.deserialize_privkey(keys[0])
+            pubkey = bitcoin.public_key_from_private_key(privkey, compressed)
+            self.assertEqual(destination, Address.from_pubkey(pubkey))
+
+    def test_extract_private_keys_not_ours(self):
+        wallet = _Wallet(self.scan_privkey, bytes.fromhex('11' * 32))
+        raw_tx, _destination = self._make_tx(bytes.fromhex(bitcoin.public_key_from_private_key(bytes.fromhex('22' * 32), True)))
+        self.assertEqual([], paycode.extract_private_keys_from_transaction(wallet, raw_tx))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
-from ..util import format_satoshis
+import threading
+
+from ..util import format_satoshis, DaemonThreadPoolExecutor
 from ..web import parse_URI
 
 class TestUtil(unittest.TestCase):
@@ -110,3 +112,24 @@ class TestUtil(unittest.TestCase):
 
     def test_parse_URI_parameter_polution(self):
         self.assertRaises(Exception, parse_URI, 'bitcoincash:15mKKb2eos1hWa6tisdPwwDC1a5J1y9nma?amount=0.0003&label=test&amount=30.0')
+
+
+class TestDaemonThreadPoolExecutor(unittest.TestCase):
+
+    def test_results_and_exceptions(self):
+        executor = DaemonThreadPoolExecutor(max_workers=2, thread_name_prefix="test")
+        self.assertEqual([1, 4, 9, 16], list(executor.map(lambda x: x * x, [1, 2, 3, 4])))
+        f = executor.submit(int, 'not a number')
+        self.assertRaises(ValueError, f.result, 5)
+        executor.shutdown()
+        self.assertRaises(RuntimeError, executor.submit, int, '1')
+
+    def test_daemon_threads(self):
+        executor = DaemonThreadPoolExecutor(max_workers=2)
+        release = threading.Event()
+        futures = [executor.submit(release.wait, 5) for _ in range(3)]
+        self.assertEqual(2, len(executor._threads))
+        self.assertTrue(all(t.daemon for t in executor._threads))
+        release.set()
+        self.assertTrue(all(f.result(5) for f in futures))
+        executor.shutdown()
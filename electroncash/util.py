@@ -24,6 +24,7 @@
 import binascii
 import os, sys, re, json, time
 from collections import defaultdict
+from concurrent.futures import Executor, Future
 from datetime import datetime
 from decimal import Decimal as PyDecimal  # Qt 5.12 also exports Decimal
 from functools import lru_cache
@@ -258,6 +259,64 @@ class DaemonThread(threading.Thread, PrintError):
         self.print_error("stopped")
 
 
+class DaemonThreadPoolExecutor(Executor):
+    """ Like concurrent.futures.ThreadPoolExecutor, but with daemon threads.
+    A ThreadPoolExecutor's threads are joined when the interpreter exits, so
+    work still running on one (such as a slow network request) holds up
+    quitting the app. The threads of this executor are just left behind. """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ''):
+        if max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0")
+        self._max_workers = max_workers
+        self._thread_name_prefix = thread_name_prefix or "DaemonThreadPoolExecutor"
+        self._work_queue = queue.Queue()  # of (Future, fn, args, kwargs), or None to make a thread exit
+        self._idle_semaphore = threading.Semaphore(0)  # released by threads waiting for work
+        self._threads = []
+        self._shutdown = False
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            f = Future()
+            self._work_queue.put((f, fn, args, kwargs))
+            # only start another thread if none is waiting for work
+            if not self._idle_semaphore.acquire(blocking=False) and len(self._threads) < self._max_workers:
+                t = threading.Thread(name=f"{self._thread_name_prefix}_{len(self._threads)}", target=self._worker,
+                                     daemon=True)
+                self._threads.append(t)
+                t.start()
+            return f
+
+    def _worker(self):
+        while True:
+            item = self._work_queue.get()
+            if item is None:
+                return
+            f, fn, args, kwargs = item
+            del item
+            if f.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    f.set_exception(e)
+                else:
+                    f.set_result(result)
+            del f, fn, args, kwargs  # don't hold on to these while waiting for more work
+            self._idle_semaphore.release()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+            for t in self._threads:
+                self._work_queue.put(None)  # one for each thread to exit on
+        if wait:
+            for t in self._threads:
+                t.join()
+
+
 # TODO: disable
 is_verbose = True
 verbose_timestamps = True
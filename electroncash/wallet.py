@@ -2171,6 +2171,8 @@ class Abstract_Wallet(PrintError, SPVDelegate):
             self.synchronizer.save()
             self.synchronizer.release()
             self.verifier.release()
+            if self.rpa_manager:
+                self.rpa_manager.stop()
             self.synchronizer = None
             self.verifier = None
             self.rpa_manager = None
@@ -3086,6 +3088,8 @@ class RpaWallet(ImportedWalletBase):
         self.storage.set_password(new_pw, encrypt)
         self.storage.write()
         self.rpa_pwd = new_pw
+        if self.rpa_manager:
+            self.rpa_manager.clear_private_key_cache()
 
     def can_change_password(self):
         return True
@@ -3120,11 +3124,15 @@ class RpaWallet(ImportedWalletBase):
         pubkey = self.keystore.address_to_pubkey(address)
         return self.keystore.export_private_key(pubkey, password)
 
-    def export_private_key_from_index(self, index, password):
-        # returns a private from the HD (rpa auxilliary) keystore based on the index
+    def get_private_key_from_index(self, index, password):
+        # returns a (privkey bytes, compressed) tuple from the HD (rpa auxilliary) keystore based on the index
         # The index is a tuple consisting of Change (boolean) and Address number.
         # for example (False,0) is the first receiving address.
-        pk, compressed = self.keystore_rpa_aux.get_private_key(index, password)
+        return self.keystore_rpa_aux.get_private_key(index, password)
+
+    def export_private_key_from_index(self, index, password):
+        # Like get_private_key_from_index, but returned in WIF format.
+        pk, compressed = self.get_private_key_from_index(index, password)
         return bitcoin.serialize_privkey(pk, compressed, self.txin_type)
 
     def add_input_sig_info(self, txin, address):
@@ -3157,8 +3165,8 @@ class RpaWallet(ImportedWalletBase):
     def get_receiving_paycode(self):
         return rpa.generate_paycode(self, prefix_size="10")
         
-    def extract_private_keys_from_transaction(self,rawtx,password):
-        return rpa.extract_private_keys_from_transaction(self, rawtx, password)
+    def extract_private_keys_from_transaction(self,rawtx,password,key_cache=None):
+        return rpa.extract_private_keys_from_transaction(self, rawtx, password, key_cache)
 
     def fetch_rpa_mempool_txs_from_server(self):
         # This function is intended to be called when the clients wants
@@ -33,11 +33,15 @@ from PyQt5.QtWidgets import *
 from .util import *
 from .qrcodewidget import QRCodeWidget
 
-import queue
+import bisect
+import threading
 import time
 import requests
 import weakref
-from typing import Callable, List, Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache, partial
+from operator import itemgetter
+from typing import Callable, List, Optional, Set, Tuple
 from enum import IntEnum
 from electroncash import lns
 from electroncash import util
@@ -48,22 +52,156 @@ from electroncash.wallet import Abstract_Wallet
 
 available = lns.available
 
+# Results of recent LNS Name resolutions, so that resolving the same name again
+# shortly after doesn't go out to the network. Verification callbacks may
+# drop entries from other threads; single dict operations are atomic, so no
+# lock is needed.
+_lns_resolve_cache = dict()  # dict of lowercased name -> tuple(expiry_time, List[Info])
+_lns_resolve_cache_ttl = 300.0  # seconds; entries also expire no later than the names they hold
+
+
+def _lookup(name: str) -> Optional[List[lns.Info]]:
+    """ Returns the cached resolution results for name, or None if there are
+    none or they have expired. """
+    key = name.strip().lower()
+    entry = _lns_resolve_cache.get(key)
+    if entry:
+        expiry, infos = entry
+        if time.time() < expiry:
+            return infos
+        _lns_resolve_cache.pop(key, None)
+
+
+def _remember(name: str, infos: List[lns.Info]):
+    """ Caches the resolution results for name. """
+    if infos:
+        expiry = min([time.time() + _lns_resolve_cache_ttl] + [info.expiryDate for info in infos])
+        _lns_resolve_cache[name.strip().lower()] = (expiry, infos)
+
+
+# Avatar images of LNS Names, so that showing the details of the same name again
+# doesn't download its avatar again. Filled in from the download threads, hence
+# the lock, which also guards _avatar_downloads.
+_avatar_cache = OrderedDict()  # OrderedDict of lowercased name -> QImage, least recently used first
+_avatar_cache_max = 256
+_avatar_cache_lock = threading.Lock()
+# Avatars being downloaded right now, so that asking for the same one again
+# before the download finishes waits for it rather than downloading it twice.
+_avatar_downloads = dict()  # dict of lowercased name -> List[Callable[[QImage], None]]
+# The avatar is just decoration, so don't wait for it as long as for lookups.
+_avatar_timeout = (3.05, 10.0)  # (connect, read) timeouts in seconds
+# Downloads run on a couple of shared threads instead of a new thread per dialog.
+# Daemon threads, so that a download in progress doesn't hold up quitting.
+_avatar_executor = util.DaemonThreadPoolExecutor(max_workers=2, thread_name_prefix="LNS avatar download")
+_avatar_size = 75  # avatars are scaled to fit a square of this many pixels
+
+
+def _fetch_avatar(name: str, success_cb: Callable[[QImage], None]):
+    """ Calls success_cb in the main thread with the avatar image of the LNS
+    Name, scaled to _avatar_size, downloading it if it's not in the cache.
+    success_cb is not called if there is no avatar or the download fails. Must
+    be called from the main thread. """
+    key = name.lower()
+    with _avatar_cache_lock:
+        img = _avatar_cache.get(key)
+        if img is not None:
+            _avatar_cache.move_to_end(key)
+        elif key in _avatar_downloads:
+            _avatar_downloads[key].append(success_cb)
+            return
+        else:
+            _avatar_downloads[key] = [success_cb]
+    if img is not None:
+        success_cb(img)
+    else:
+        _avatar_executor.submit(_download_avatar, name)
+
+
+def _cancel_avatar(name: str, success_cb: Callable[[QImage], None]):
+    """ Stops success_cb from being called by a _fetch_avatar(name, success_cb)
+    still in progress, eg because the dialog it was for was closed. A download
+    that nobody waits for anymore is skipped if it hasn't started yet. Must be
+    called from the main thread. """
+    with _avatar_cache_lock:
+        callbacks = _avatar_downloads.get(name.lower(), [])
+        if success_cb in callbacks:
+            callbacks.remove(success_cb)
+
+
+def _download_avatar(name: str):
+    key = name.lower()
+    with _avatar_cache_lock:
+        if not _avatar_downloads.get(key):
+            # canceled before we got to it
+            _avatar_downloads.pop(key, None)
+            return
+    img = None
+    try:
+        avatar_url = f'https://metadata.bch.domains/smartbch/avatar/{name}'
+        # use the LNS module's pooled session so the connection is kept alive between lookups
+        r = lns.session.get(avatar_url, allow_redirects=True, timeout=_avatar_timeout)
+        if r.ok:
+            # Decode and scale the image here rather than in the main thread.
+            # Unlike QPixmap, QImage may be used outside of the main thread.
+            img = QImage()
+            if img.loadFromData(r.content):
+                img = img.scaled(_avatar_size, _avatar_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            else:
+                img = None
+    finally:
+        # also when the download failed, so that the next request for this avatar tries again
+        with _avatar_cache_lock:
+            callbacks = _avatar_downloads.pop(key, [])
+            if img is not None:
+                _avatar_cache[key] = img
+                _avatar_cache.move_to_end(key)
+                while len(_avatar_cache) > _avatar_cache_max:
+                    _avatar_cache.popitem(last=False)
+    if img is not None:
+        for cb in callbacks:
+            util.do_in_main_thread(cb, img)
+
+
+@lru_cache(maxsize=16)
+def _icon_pixmap(path: str, size: int) -> QPixmap:
+    """ Returns the icon at path as a pixmap of the given size. Cached, so the
+    icon isn't loaded and scaled again every time one of our dialogs opens. """
+    return QIcon(path).pixmap(size)
+
+
+@lru_cache(maxsize=1)
+def _copy_icon() -> QIcon:
+    """ Returns the icon of the copy buttons, shared by all of them. """
+    return QIcon(":icons/copy.png")
+
+
+@lru_cache(maxsize=64)
+def _qr_pixmap(data: str, size: int) -> QPixmap:
+    """ Returns the QR code for data drawn on a size x size pixmap. Cached, so
+    showing the details of the same LNS Name again doesn't encode its QR codes
+    again. """
+    pix = QPixmap(size, size)
+    pix.fill(Qt.transparent)
+    # without the window background, like the QRCodeWidget would be drawn in place
+    QRCodeWidget(data, fixedSize=size).render(pix, flags=QWidget.RenderFlags(QWidget.DrawChildren))
+    return pix
+
 
 class VerifyingDialog(WaitingDialog):
 
     def __init__(self, parent, message, task, on_success=None, on_error=None, auto_cleanup=True,
                  *, auto_show=True, auto_exec=False, title=None, disable_escape_key=False):
-        main_thread_success_cb = lambda x: util.do_in_main_thread(on_success, x) if on_success else None
-        main_thread_error_cb = lambda x: util.do_in_main_thread(on_error, x) if on_error else None
-        super().__init__(parent, message, task, on_success=main_thread_success_cb,
-                         on_error=main_thread_error_cb, auto_cleanup=auto_cleanup,
+        # No need to wrap the callbacks with util.do_in_main_thread, the
+        # TaskThread of the WaitingDialog already calls them in the main thread.
+        super().__init__(parent, message, task, on_success=on_success,
+                         on_error=on_error, auto_cleanup=auto_cleanup,
                          auto_show=False, auto_exec=False,
                          title=title or _('Verifying LNS Name'),
                          disable_escape_key=disable_escape_key)
         hbox = QHBoxLayout()
         self._vbox.removeWidget(self._label)
         icon_lbl = QLabel()
-        icon_lbl.setPixmap(QIcon(":icons/lns.png").pixmap(50))
+        icon_lbl.setPixmap(_icon_pixmap(":icons/lns.png", 50))
         hbox.addWidget(icon_lbl)
         hbox.addWidget(self._label)
         self._vbox.addLayout(hbox)
@@ -77,37 +215,55 @@ class VerifyingDialog(WaitingDialog):
         destroyed_print_error(self)
 
 
-def verify_multiple_names(names : List[str], parent : MessageBoxMixin, wallet : Abstract_Wallet, timeout=10.0) -> int:
-    """ Pass a list of names and will attempt to verify them all in 1 pass.
+def verify_multiple_names(names : Set[str], parent : MessageBoxMixin, wallet : Abstract_Wallet, timeout=10.0) -> int:
+    """ Pass a set of names and will attempt to verify them all in 1 pass.
     This is used by the Contacts tab to verify unverified LNS Names that
     may have been imported. Returns the number of successfully verified names
     or None on user cancel. """
     if not len(names):
         return 0
-    names = set(names)
     nnames = len(names)
-    q = queue.Queue()
+    # Names that were resolved recently count as verified without asking the
+    # network again.
+    cached = {n for n in names
+              if any(info.name.lower() == n.strip().lower() for info in _lookup(n) or [])}
+    names = set(names) - cached
+    ctr = len(cached)
+    if not names:
+        return ctr
+    # Lowercased names we are still waiting to hear about
+    pending = {n.strip().lower() for n in names}
+    # verify_name_asynch answers for the whole set of names at once, so all we
+    # need is that answer and a signal that it arrived.
+    answers = []  # guarded with answers_lock
+    answers_lock = threading.Lock()
+    answered = threading.Event()
     def done_cb(thing):
-        if isinstance(thing, (Exception, list)):
-            q.put(thing)
-        else:
-            q.put(None)
-    ctr = 0
+        if isinstance(thing, list):
+            # These were just verified from the network, so drop any older
+            # resolution results held for them.
+            for info in thing:
+                _lns_resolve_cache.pop(info.name.lower(), None)
+        with answers_lock:
+            answers.append(thing)
+        answered.set()
     def thread_func():
         nonlocal ctr
         wallet.lns.verify_name_asynch(name=names, success_cb=done_cb, error_cb=done_cb, timeout=timeout)
-        errs = 0
-        while ctr + errs < nnames:
-            try:
-                thing = q.get(timeout=timeout)
-                if thing is None:
-                    errs += 1
-                elif isinstance(thing, Exception):
-                    raise thing
-                else:
-                    ctr += len(thing)
-            except queue.Empty:
-                return
+        if not answered.wait(timeout):
+            return
+        with answers_lock:
+            things = list(answers)
+        for thing in things:
+            if isinstance(thing, Exception):
+                raise thing
+            elif isinstance(thing, list):
+                for info in thing:
+                    name = info.name.lower()
+                    if name in pending:
+                        pending.discard(name)
+                        ctr += 1
+        # any names still pending were not found
     code = VerifyingDialog(parent.top_level_window(),
                            ngettext("Verifying {count} name please wait ...",
                                     "Verifying {count} names please wait ...", nnames).format(count=nnames),
@@ -139,17 +295,31 @@ def resolve_lns(parent: MessageBoxMixin, name: str, wallet: Abstract_Wallet = No
         if not lns_tup:
             raise Bad(_("Invalid LNS Name specified: {name}").format(name=name))
         results = None
-        def resolve_verify():
-            nonlocal results
-            results = wallet.lns.resolve_verify(name)
+        if name in wallet.contacts.names_by_type('lns'):
+            # A contact of ours. If we still hold its verified info, there is
+            # no need to go out to the network.
+            info = wallet.lns.get_verified(name)
+            if info and info.expiryDate > time.time():
+                results = [info]
+        if not results:
+            results = _lookup(name)
+        if results:
+            # resolved recently, no need to go out to the network again
+            results = [(item, item.name) for item in results]
+        else:
+            def resolve_verify():
+                nonlocal results
+                results = wallet.lns.resolve_verify(name)
+                if results:
+                    results = [(item, item.name) for item in results]
+            code = VerifyingDialog(parent.top_level_window(),
+                                   _("Verifying LNS Name {name} please wait ...").format(name=name),
+                                   resolve_verify, on_error=lambda e: parent.show_error(str(e)), auto_show=False).exec_()
+            if code == QDialog.Rejected:
+                # user cancel operation
+                return
             if results:
-                results = [(item, item.name) for item in results]
-        code = VerifyingDialog(parent.top_level_window(),
-                               _("Verifying LNS Name {name} please wait ...").format(name=name),
-                               resolve_verify, on_error=lambda e: parent.show_error(str(e)), auto_show=False).exec_()
-        if code == QDialog.Rejected:
-            # user cancel operation
-            return
+                _remember(name, [item for item, _name in results])
         if not results:
             raise Bad(_("LNS Name not found: {name}").format(name=name) + "\n\n"
                       + _("Could not find the LNS Name specified. "
@@ -194,21 +364,41 @@ class ButtonAssociatedLabel(QLabel):
                 QToolTip.showText(QCursor.pos(), self.but.toolTip(), self)
 
 
-def naked_button_style() -> str:
+_naked_button_styles = dict()  # dict of (ColorScheme.dark_scheme, selector) -> stylesheet str; filled by naked_button_style()
+
+# Selects the buttons marked by button_make_naked(but, styled_by_parent=True)
+NAKED_BUTTON_SELECTOR = 'QPushButton[naked="true"]'
+
+
+def naked_button_style(selector: str = 'QPushButton') -> str:
     """ Returns a stylesheet for a small 'naked' (flat) QPushButton button which
-    is used in the lookup results and other associated widgets in this file """
-    but_style_sheet = 'QPushButton { border-width: 1px; padding: 0px; margin: 0px; }'
-    if not ColorScheme.dark_scheme:
-        but_style_sheet += ''' QPushButton { border: 1px solid transparent; }
-        QPushButton:hover { border: 1px solid #3daee9; }'''
+    is used in the lookup results and other associated widgets in this file.
+    Pass NAKED_BUTTON_SELECTOR as the selector to get a stylesheet for a parent
+    widget, which then styles all the naked buttons inside it. """
+    dark = bool(ColorScheme.dark_scheme)
+    but_style_sheet = _naked_button_styles.get((dark, selector))
+    if but_style_sheet is None:
+        but_style_sheet = selector + ' { border-width: 1px; padding: 0px; margin: 0px; }'
+        if not dark:
+            but_style_sheet += f''' {selector} {{ border: 1px solid transparent; }}
+            {selector}:hover {{ border: 1px solid #3daee9; }}'''
+        _naked_button_styles[(dark, selector)] = but_style_sheet
     return but_style_sheet
 
 
-def button_make_naked(but: QAbstractButton) -> QAbstractButton:
+def button_make_naked(but: QAbstractButton, *, styled_by_parent: bool = False) -> QAbstractButton:
     """ Just applied a bunch of things to a button to "make it naked"
     which is the look we use for the lookup results and various other odds and
-    ends. Returns the button passed to it. """
-    but.setStyleSheet(naked_button_style())
+    ends. Returns the button passed to it.
+
+    If styled_by_parent is True, the button is just marked as naked rather than
+    given its own stylesheet, and one of its parents must have the stylesheet
+    naked_button_style(NAKED_BUTTON_SELECTOR). This saves parsing a stylesheet
+    per button when there are many of them. """
+    if styled_by_parent:
+        but.setProperty('naked', True)
+    else:
+        but.setStyleSheet(naked_button_style())
     but.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
     return but
 
@@ -256,6 +446,9 @@ class InfoGroupBox(PrintError, QGroupBox):
         self.vbox.setContentsMargins(0,0,0,0)
         self.vbox.addWidget(self.w)
         self._but_grp = QButtonGroup(self)  # client code shouldn't use this but instead use selectedItems(), etc
+        self.setStyleSheet(naked_button_style(NAKED_BUTTON_SELECTOR))  # styles the naked buttons of all the rows
+        self._rows = dict()  # dict of lns name -> tuple(item, button, lns_label, details_label, button_bar, address_label); the on-screen rows, reused by refresh()
+        self._rows_button_type = None  # the button type self._rows were made for
         self.no_items_text = _('No LNS Names')  # client code may set this directly
 
     def setItems(self,
@@ -266,16 +459,15 @@ class InfoGroupBox(PrintError, QGroupBox):
         nitems = len(items)
         title = ngettext("{number} LNS Name", "{number} LNS Names", nitems).format(number=nitems) if title is None else title
         wallet = self.wallet
-        if items and sort:
-            # sort items by formatted LNS Name string, also adding the string to
-            # the items tuples; tuples now are modified to 2 elements:
+        if items:
+            # add the formatted LNS Name string to the items tuples, and sort
+            # items by it; tuples now are modified to 2 elements:
             # (info, formatted_ca_string)
-            formatter = lambda x: (x[0], wallet.lns.fmt_info(x[0]))
+            fmt_info = wallet.lns.fmt_info
+            items = [(x[0], fmt_info(x[0])) for x in items]
             if sort:
-                items = sorted((formatter(x) for x in items), key=lambda tup:tup[1])
-            else:
-                items = [formatter(x) for x in items]
-        self._items = items
+                items.sort(key=itemgetter(1))
+        self._items = items  # always 2-tuples, refresh() relies on this
         self.button_type = button_type
         self.setTitle(title)
         self.refresh()
@@ -323,23 +515,52 @@ class InfoGroupBox(PrintError, QGroupBox):
         return ret
 
     def refresh(self):
+        # Rebuild with updates (and the button group's signals) off, so that
+        # Qt lays out and repaints the new grid once at the end rather than as
+        # each widget is added to it.
+        self.setUpdatesEnabled(False)
+        was_blocked = self._but_grp.blockSignals(True)
+        try:
+            self._refresh()
+        finally:
+            self._but_grp.blockSignals(was_blocked)
+            self.setUpdatesEnabled(True)
+            if self.w:
+                self.w.updateGeometry()
+
+    def _refresh(self):
         from .main_window import ElectrumWindow
         parent = self.main_window
-        wallet = self.wallet
         items = self._items
         button_type = self.button_type
-        assert all(len(x) == 2 for x in items)
         but_grp = self._but_grp
         cols, col, row = 2, 0, -1
 
+        # The widgets of rows whose item is still on-screen are reused, only
+        # rows for new items get created. If the button type changed, none of
+        # the old rows can be reused.
+        if button_type == self._rows_button_type:
+            old_rows = self._rows
+        else:
+            old_rows = dict()
+        self._rows = dict()
+        self._rows_button_type = button_type
+
         if self.w:
             # save selection
             saved_selection = [tup[0] for tup in self.selectedItems()]
             # tear down the dummy container widget from before and everything
-            # in it
-            for c in self.findChildren(QAbstractButton, "InfoGroupBoxButton"):
-                if isinstance(c, QAbstractButton):
-                    but_grp.removeButton(c)
+            # in it, except for the rows we are going to reuse
+            for c in but_grp.buttons():
+                but_grp.removeButton(c)
+            old_grid = self.w.layout()
+            for item in items:
+                row_widgets = old_rows.get(item[0].name)
+                if row_widgets and row_widgets[0] == item:
+                    # the button bar is a layout, it has to be taken out of
+                    # the old grid before it can go into the new one
+                    old_grid.removeItem(row_widgets[4])
+                    row_widgets[4].setParent(None)
             self.w.hide()
             self.vbox.removeWidget(self.w)
             self.w.setParent(None)
@@ -353,18 +574,6 @@ class InfoGroupBox(PrintError, QGroupBox):
         if self.custom_contents_margins:
             grid.setContentsMargins(*self.custom_contents_margins)
 
-        def details_link_activated(lnsstr):
-            if isinstance(parent, ElectrumWindow):
-                lns_detail_dialog(parent, lnsstr)
-
-        def view_addr_link_activated(addr):
-            if isinstance(parent, ElectrumWindow):
-                try:
-                    address = Address.from_string(addr)
-                    parent.show_address(address, parent=parent.top_level_window())
-                except Exception as e:
-                    parent.print_error(repr(e))
-
 
         # We do it this way with BUTTON_FACTORY in case we want to expand
         # this facility later to generate even more dynamic buttons.
@@ -375,6 +584,7 @@ class InfoGroupBox(PrintError, QGroupBox):
             BUTTON_FACTORY = lambda *args: QRadioButton()
             but_grp.setExclusive(True)
         hide_but = button_type == __class__.ButtonType.NoButton
+        is_elec = isinstance(parent, ElectrumWindow)  # the same for every row, so just check it once
 
         grid.setVerticalSpacing(4)
 
@@ -389,74 +599,26 @@ class InfoGroupBox(PrintError, QGroupBox):
             if not col:
                 row += 1
             info, lns_string = item
-            lns_string_em = info.name
-            # Radio button (by itself in colum 0)
-            rb = BUTTON_FACTORY(info, "", lns_string, lns_string_em)
-            rb.setObjectName("InfoGroupBoxButton")
-            rb.setHidden(hide_but)
-            rb.setDisabled(hide_but)  # hidden buttons also disabled to prevent user clicking their labels to select them
-            is_valid = True
-            is_mine = False
-            is_change = False
-            assert isinstance(info.address, Address)
-            if wallet.is_mine(info.address):
-                is_mine = True
-                is_change = wallet.is_change(info.address)
+            row_widgets = old_rows.get(info.name)
+            if row_widgets and row_widgets[0] == item:
+                _item, rb, lns_lbl, details_lbl, hbox, addr_lbl = row_widgets
+                # Reused buttons start out unchecked, like new ones; the
+                # selection is restored below. A checked radio button can't
+                # be unchecked while it is auto-exclusive.
+                auto_exclusive = rb.autoExclusive()
+                rb.setAutoExclusive(False)
+                rb.setChecked(False)
+                rb.setAutoExclusive(auto_exclusive)
+            else:
+                rb, lns_lbl, details_lbl, hbox, addr_lbl = self._make_row(item, BUTTON_FACTORY, hide_but, is_elec)
+            self._rows[info.name] = (item, rb, lns_lbl, details_lbl, hbox, addr_lbl)
+
             but_grp.addButton(rb, i)
             grid.addWidget(rb, row*3, col*5, 1, 1)
-            pretty_string = lns_string
-
-            # LNS Name
-            lns_lbl = ButtonAssociatedLabel(f'<b>{pretty_string}</b>', button=rb)
             grid.addWidget(lns_lbl, row*3, col*5+1, 1, 1)
-
-            # Details
-            details = _("Details")
-            details_lbl = WWLabel(f'<font size=-1><a href="{lns_string}">{details}...</a></font>')
-            details_lbl.setToolTip(_("View Details"))
             grid.addWidget(details_lbl, row*3, col*5+2, 1, 1)
-
-            # misc buttons
-            hbox = QHBoxLayout()
-            hbox.setContentsMargins(0,0,0,0)
-            hbox.setSpacing(4)
-            for func in self.extra_buttons:
-                if callable(func):
-                    ab = func(item)
-                    if isinstance(ab, QAbstractButton):
-                        button_make_naked(ab)
-                        hbox.addWidget(ab)
-            # copy button
-            copy_but = QPushButton(QIcon(":icons/copy.png"), "")
-            button_make_naked(copy_but)
-            hbox.addWidget(copy_but)
             grid.addLayout(hbox, row*3, col*5+3, 1, 1)
-            # end button bar
-
-            if isinstance(parent, ElectrumWindow):
-                details_lbl.linkActivated.connect(details_link_activated)
-                copy_but.clicked.connect(lambda ignored=None, name=lns_string_em, copy_but=copy_but:
-                                             parent.copy_to_clipboard(text=name, tooltip=_('LNS Name copied to clipboard'), widget=copy_but) )
-                copy_but.setToolTip('<span style="white-space:nowrap">'
-                                    + _("Copy <b>{text}</b>").format(text=lns_string_em)
-                                    + '</span>')
-            else:
-                details_lbl.setHidden(True)
-                copy_but.setHidden(True)
-
-            if self.show_addresses:
-                addr_lbl = ButtonAssociatedLabel('', button=rb)
-                if is_valid:
-                    if is_mine:
-                        addr_lbl.setText(f'<a href="{info.address.to_ui_string()}"><pre>{info.address.to_ui_string()}</pre></a>')
-                        addr_lbl.linkActivated.connect(view_addr_link_activated)
-                        addr_lbl.setToolTip(_('Wallet') + ' - ' + (_('Change Address') if is_change else _('Receiving Address')))
-                        addr_lbl.setButton(None)  # disable click to select
-                    else:
-                        addr_lbl.setText(f'<pre>{info.address.to_ui_string()}</pre>')
-                else:
-                    addr_lbl.setText('<i>' + _('Unsupported Account Type') + '</i>')
-                    addr_lbl.setToolTip(rb.toolTip())
+            if addr_lbl:
                 grid.addWidget(addr_lbl, row*3+1, col*5+1, 1, 3)
 
             if (col % cols) == 0:
@@ -490,6 +652,95 @@ class InfoGroupBox(PrintError, QGroupBox):
         else:
             self.checkItemWithInfo(None)
 
+    def _make_row(self, item, BUTTON_FACTORY, hide_but, is_elec):
+        """ Creates the widgets for one item. Returns a tuple of:
+        (button, lns_label, details_label, button_bar_layout, address_label_or_None) """
+        wallet = self.wallet
+        info, lns_string = item
+        lns_string_em = info.name
+        # Radio button (by itself in colum 0)
+        rb = BUTTON_FACTORY(info, "", lns_string, lns_string_em)
+        rb.setObjectName("InfoGroupBoxButton")
+        rb.setHidden(hide_but)
+        rb.setDisabled(hide_but)  # hidden buttons also disabled to prevent user clicking their labels to select them
+        is_valid = isinstance(info.address, Address)
+        is_mine = False
+        is_change = False
+        if is_valid and wallet.is_mine(info.address):
+            is_mine = True
+            is_change = wallet.is_change(info.address)
+        pretty_string = lns_string
+
+        # LNS Name
+        lns_lbl = ButtonAssociatedLabel(f'<b>{pretty_string}</b>', button=rb)
+
+        # Details
+        details = _("Details")
+        details_lbl = WWLabel(f'<font size=-1><a href="{lns_string}">{details}...</a></font>')
+        details_lbl.setToolTip(_("View Details"))
+
+        # misc buttons
+        hbox = QHBoxLayout()
+        hbox.setContentsMargins(0,0,0,0)
+        hbox.setSpacing(4)
+        for func in self.extra_buttons:
+            if callable(func):
+                ab = func(item)
+                if isinstance(ab, QAbstractButton):
+                    button_make_naked(ab, styled_by_parent=True)
+                    hbox.addWidget(ab)
+        # copy button
+        copy_but = QPushButton(_copy_icon(), "")
+        button_make_naked(copy_but, styled_by_parent=True)
+        hbox.addWidget(copy_but)
+        # end button bar
+
+        if is_elec:
+            details_lbl.linkActivated.connect(self._on_details_link_activated)
+            copy_but.setProperty('lnsName', lns_string_em)
+            copy_but.clicked.connect(self._on_copy_clicked)
+            copy_but.setToolTip('<span style="white-space:nowrap">'
+                                + _("Copy <b>{text}</b>").format(text=lns_string_em)
+                                + '</span>')
+        else:
+            details_lbl.setHidden(True)
+            copy_but.setHidden(True)
+
+        addr_lbl = None
+        if self.show_addresses:
+            addr_lbl = ButtonAssociatedLabel('', button=rb)
+            if is_valid:
+                if is_mine:
+                    addr_lbl.setText(f'<a href="{info.address.to_ui_string()}"><pre>{info.address.to_ui_string()}</pre></a>')
+                    # the link text is just info.address, so show that rather than parsing the text back
+                    addr_lbl.linkActivated.connect(partial(self._on_address_link_activated, info.address))
+                    addr_lbl.setToolTip(_('Wallet') + ' - ' + (_('Change Address') if is_change else _('Receiving Address')))
+                    addr_lbl.setButton(None)  # disable click to select
+                else:
+                    addr_lbl.setText(f'<pre>{info.address.to_ui_string()}</pre>')
+            else:
+                addr_lbl.setText('<i>' + _('Unsupported Account Type') + '</i>')
+                addr_lbl.setToolTip(rb.toolTip())
+
+        return rb, lns_lbl, details_lbl, hbox, addr_lbl
+
+    # The slots below are shared by all the rows. A row's state either comes
+    # from the signal itself, from a property of the sending widget, or is
+    # bound to the slot with functools.partial, rather than captured in a
+    # closure per row.
+
+    def _on_details_link_activated(self, lns_string):
+        lns_detail_dialog(self.main_window, lns_string)
+
+    def _on_copy_clicked(self, *args):
+        copy_but = self.sender()
+        if copy_but:
+            self.main_window.copy_to_clipboard(text=copy_but.property('lnsName'),
+                                               tooltip=_('LNS Name copied to clipboard'), widget=copy_but)
+
+    def _on_address_link_activated(self, address, *args):
+        self.main_window.show_address(address, parent=self.main_window.top_level_window())
+
 
 def multiple_result_picker(parent, results, wallet=None, msg=None, title=None,
                            gbtext=None) -> Optional[Tuple[lns.Info, str]]:
@@ -550,12 +801,14 @@ def lookup_lns_dialog(
     d.setObjectName("WindowModalDialog - " + title)
     finalization_print_error(d)
     destroyed_print_error(d)
-    all_lns_contacts = set(contact.name for contact in wallet.contacts.get_all(nocopy=True) if contact.type == 'lns')
+    lns_contacts_added = set()  # names added to Contacts while this dialog is up
+    def in_contacts(lns_string):
+        return lns_string in lns_contacts_added or lns_string in wallet.contacts.names_by_type('lns')
 
     vbox = QVBoxLayout(d)
     hbox = QHBoxLayout()
     label = QLabel()
-    label.setPixmap(QIcon(":icons/lns.png").pixmap(50))
+    label.setPixmap(_icon_pixmap(":icons/lns.png", 50))
     hbox.addWidget(label)
     hbox.addItem(QSpacerItem(10, 1))
     label = QLabel("<font size=+1><b>" + title + "</b></font>" + blurb)
@@ -591,16 +844,18 @@ def lookup_lns_dialog(
     extra_buttons = []
     # Extra Buttons
     if add_to_contacts_button:
+        contacts_icon = QIcon(":icons/tab_contacts.png")
         def create_add_to_contacts_button_callback(item: tuple) -> QPushButton:
+            # item[1] is already wallet.lns.fmt_info(info), see InfoGroupBox.setItems
             info, lns_string = item
-            lns_string_em = wallet.lns.fmt_info(info)
-            but = QPushButton(QIcon(":icons/tab_contacts.png"), "")
+            lns_string_em = lns_string
+            but = QPushButton(contacts_icon, "")
             if isinstance(info.address, Address):
-                if lns_string not in all_lns_contacts and wallet.is_mine(info.address):
+                if not in_contacts(lns_string) and wallet.is_mine(info.address):
                     # We got a result for an LNS that happens to be ours. Remember it.
                     parent.set_contact(label=lns_string, address=info.address, typ='lns', resolved=info)
-                    all_lns_contacts.add(lns_string)
-                if lns_string in all_lns_contacts:
+                    lns_contacts_added.add(lns_string)
+                if in_contacts(lns_string):
                     but.setDisabled(True)
                     but.setToolTip(_('<span style="white-space:nowrap"><b>{lns_name}</b> already in Contacts</span>')
                                    .format(lns_name=lns_string_em))
@@ -618,7 +873,7 @@ def lookup_lns_dialog(
                                    .format(lns_name=lns_string_em))
                             but.setDisabled(True)
                             but.setToolTip(msg)
-                            all_lns_contacts.add(new_contact.name)
+                            lns_contacts_added.add(new_contact.name)
                         else:
                             msg = _("Error occurred adding to Contacts")
                         QToolTip.showText(QCursor.pos(), msg, frame, QRect(), 5000)
@@ -630,11 +885,11 @@ def lookup_lns_dialog(
             return but
         extra_buttons.append(create_add_to_contacts_button_callback)
     if pay_to_button:
+        payto_icon = QIcon(":icons/paper-plane.svg" if not ColorScheme.dark_scheme else ":icons/paper-plane_dark_theme.svg")
         def create_payto_but(item):
-            info, _name = item
-            lns_string_em = wallet.lns.fmt_info(info)
-            icon_file = ":icons/paper-plane.svg" if not ColorScheme.dark_scheme else ":icons/paper-plane_dark_theme.svg"
-            but = QPushButton(QIcon(icon_file), "")
+            # item[1] is already wallet.lns.fmt_info(info), see InfoGroupBox.setItems
+            info, lns_string_em = item
+            but = QPushButton(payto_icon, "")
             if isinstance(info.address, Address):
                 payto_str = _("Pay to")
                 but.setToolTip(f'<span style="white-space:nowrap">{payto_str}<br>&nbsp;&nbsp;&nbsp;'
@@ -674,44 +929,71 @@ def lookup_lns_dialog(
             info_gb.refresh()
         tit_lbl.setText('')
 
+    parsed = dict()  # dict of text -> wallet.lns.parse_string(text), for the last few texts typed in
+    def parse_string(txt):
+        if txt not in parsed:
+            if len(parsed) >= 32:
+                parsed.pop(next(iter(parsed)))  # forget the oldest
+            parsed[txt] = wallet.lns.parse_string(txt)
+        return parsed[txt]
+
+    # The name typed in is only checked once typing pauses, not on every keystroke.
+    parse_timer = QTimer(d)
+    parse_timer.setSingleShot(True)
+    parse_timer.setInterval(150)
+
     def on_return_pressed():
+        if parse_timer.isActive():
+            # don't make the user wait for the check of what they just typed
+            on_parse_timer()
         if need_to_fwd_return and search.isEnabled():
             search.click()
 
     def on_text_changed(txt):
-        txt = txt.strip() if txt else ''
-        search.setEnabled(bool(wallet.lns.parse_string(txt)))
+        parse_timer.start()
+
+    def on_parse_timer():
+        parse_timer.stop()
+        txt = acct.text().strip()
+        search.setEnabled(bool(parse_string(txt)))
         if not txt and not info_gb.items():
             my_msg(" ")
 
     def on_search():
         ok.setDisabled(ok_disables)
         name = acct.text().strip()
-        tup = wallet.lns.parse_string(name)
+        tup = parse_string(name)
         if tup:
             my_msg(_("Searching for <b>{lns_name}</b> please wait ...").format(lns_name=name), True)
             results: Optional[List] = None
             exc = []
-            t0 = time.time()
-            def resolve_verify():
-                nonlocal results
-                results = wallet.lns.resolve_verify(name, exc=exc)
+            t0 = time.monotonic()
+            results = _lookup(name)
+            if results:
+                # searched for recently, no need to go out to the network again
+                results = [(item, item.name) for item in results]
+            else:
+                def resolve_verify():
+                    nonlocal results
+                    results = wallet.lns.resolve_verify(name, exc=exc)
+                    if results:
+                        results = [(item, item.name) for item in results]
+                code = VerifyingDialog(parent.top_level_window(),
+                                       _("Verifying LNS Name {name} please wait ...").format(name=name),
+                                       resolve_verify, auto_show=False).exec_()
+                if code == QDialog.Rejected:
+                    # user cancel -- the waiting dialog thread will continue to run in the background
+                    # but that's ok.. it will be a no-op
+                    d.reject()
+                    return
                 if results:
-                    results = [(item, item.name) for item in results]
-            code = VerifyingDialog(parent.top_level_window(),
-                                   _("Verifying LNS Name {name} please wait ...").format(name=name),
-                                   resolve_verify, auto_show=False).exec_()
-            if code == QDialog.Rejected:
-                # user cancel -- the waiting dialog thread will continue to run in the background
-                # but that's ok.. it will be a no-op
-                d.reject()
-                return
+                    _remember(name, [item for item, _name in results])
             if results:
                 # suppress groupbox title
                 info_gb.setItems(results, auto_resize_parent=False, title='', button_type=button_type)
             else:
                 my_msg(_("The specified LNS Name does not appear to be associated with any BCH address"), True)
-                if time.time()-t0 >= lns.timeout:
+                if time.monotonic()-t0 >= lns.timeout:
                     # check these are still alive: these could potentially go away from under us if wallet is stopped
                     # when we get here.
                     if (wallet.verifier and wallet.synchronizer and
@@ -733,10 +1015,15 @@ def lookup_lns_dialog(
         else:
             my_msg(_("Invalid LNS Name, please try again"), True)
 
+    def on_item_clicked(button):
+        # Only when a check box was just unchecked do the other buttons need looking at
+        ok.setEnabled(ok_disables and (button.isChecked() or info_gb.selectedItem() is not None))
+
     acct.textChanged.connect(on_text_changed)
+    parse_timer.timeout.connect(on_parse_timer)
     search.clicked.connect(on_search)
     acct.returnPressed.connect(on_return_pressed)
-    info_gb.buttonGroup().buttonClicked.connect(lambda x=None: ok.setEnabled(ok_disables and info_gb.selectedItem() is not None))
+    info_gb.buttonGroup().buttonClicked.connect(on_item_clicked)
 
     my_msg(" ")
 
@@ -746,6 +1033,20 @@ def lookup_lns_dialog(
     return None
 
 
+# Font sizes (in pt) of the name in lns_detail_dialog: _name_font_sizes[i] is
+# used for names no longer than _name_font_size_lengths[i], the last for longer names.
+_name_font_size_lengths = [20, 30, 50, 90]
+_name_font_sizes = [26, 15, 12, 10, 8]
+
+# The rich text of the labels in lns_detail_dialog, filled in with str.format
+_name_html = '<span style="white-space:nowrap; font-size:{fsize}pt; font-weight:bold;">{name}</span></span>'
+_addr_html = '<span style="white-space:nowrap; font-size:15pt;"><a href="{addr}"><pre>{addr}</pre></a></span>'
+_reg_date_html = '<span style="white-space:nowrap; font-size:15pt;">Registration date:&nbsp;{date}</span>'
+_exp_date_html = ('<span style="white-space:nowrap; font-size:15pt;">Expiry date:'
+                  '&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;{date}</span>')
+_view_html = '<span style="white-space:nowrap; font-size:11pt;">{ismine} <a href="{url}">{text}</a></span>'
+
+
 def lns_detail_dialog(parent: MessageBoxMixin,  # Should be an ElectrumWindow instance
                       lns_string: str,  # LNS name string eg: "satoshi.bch"
                       *, title: str = None  # The modal dialog window title
@@ -795,40 +1096,27 @@ def lns_detail_dialog(parent: MessageBoxMixin,  # Should be an ElectrumWindow in
     grid = QGridLayout(d)
     avatar_lbl = QLabel()
     weak_avatar_lbl = weakref.ref(avatar_lbl)
-    def success_cb(data):
+    def success_cb(img):
         """This must run in the main thread, but it may be called at any time, including after outer scope ends."""
         strong_avatar_lbl = weak_avatar_lbl()
         if not strong_avatar_lbl:
             return
         try:
             strong_avatar_lbl.setText('')
-            pix = QPixmap()
-            pix.loadFromData(data)
-            strong_avatar_lbl.setPixmap(pix.scaled(75, 75, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            strong_avatar_lbl.setPixmap(QPixmap.fromImage(img))
         except:
             pass
 
-    def thread_func():
-        avatar_url = f'https://metadata.bch.domains/smartbch/avatar/{lns_string}'
-        r = requests.get(avatar_url,  allow_redirects=True)
-        if r.ok:
-            util.do_in_main_thread(success_cb, r.content)
-
-    threading.Thread(name=f"LNS avatar download for {lns_string}", target=thread_func, daemon=True).start()
+    _fetch_avatar(lns_string, success_cb)
+    def on_finished(result):
+        # don't download the avatar for nothing if the dialog is closed before the download starts
+        _cancel_avatar(lns_string, success_cb)
+    d.finished.connect(on_finished)
 
     avatar_lbl.setToolTip(f'<span style="white-space:nowrap;">{info.name}</span>')
     grid.addWidget(avatar_lbl, 0, 0, 3, 1)
-    fsize = 26
-    if len(info.name) > 20:
-        fsize = 15
-    if len(info.name) > 30:
-        fsize = 12
-    if len(info.name) > 50:
-        fsize = 10
-    if len(info.name) > 90:
-        fsize = 8
-    name_txt = f'<span style="white-space:nowrap; font-size:{fsize}pt; font-weight:bold;">{info.name}'
-    name_txt += '</span></span>'
+    fsize = _name_font_sizes[bisect.bisect_left(_name_font_size_lengths, len(info.name))]
+    name_txt = _name_html.format(fsize=fsize, name=info.name)
 
     def open_link(link):
         if Address.is_valid(link):
@@ -848,34 +1136,36 @@ def lns_detail_dialog(parent: MessageBoxMixin,  # Should be an ElectrumWindow in
     grid.addWidget(name_lbl, 0, 1, 1, 1)
     # copy name
     copy_name_but = QPushButton()
-    copy_name_but.setIcon(QIcon(":icons/copy.png"))
+    copy_name_but.setIcon(_copy_icon())
     button_make_naked(copy_name_but)
     copy_name_but.setToolTip('<span style="white-space:nowrap">'
                                 + _("Copy <b>{lns_name}</b>").format(lns_name=info.name)
                                 + '</span>')
-    copy_name_but.clicked.connect(lambda ignored=None, lns_string_em=info.name, copy_but=copy_name_but:
-                                  parent.copy_to_clipboard(text=lns_string_em,
-                                                           tooltip=_('LNS Name copied to clipboard'), widget=copy_but))
+    def copy_name(ignored=None):
+        parent.copy_to_clipboard(text=info.name, tooltip=_('LNS Name copied to clipboard'), widget=copy_name_but)
+    copy_name_but.clicked.connect(copy_name)
     grid.addWidget(copy_name_but, 0, 2, 1, 1)
     # address label
-    addr_lbl = QLabel(f'<span style="white-space:nowrap; font-size:15pt;"><a href="{info.address.to_ui_string()}"><pre>{info.address.to_ui_string()}</pre></a></span>')
+    addr_str = info.address.to_ui_string()
+    addr_lbl = QLabel(_addr_html.format(addr=addr_str))
     addr_lbl.linkActivated.connect(open_link)
     grid.addWidget(addr_lbl, 1, 1, 1, 1)
     # copy address label
     copy_addr_but = QPushButton()
-    copy_addr_but.setIcon(QIcon(":icons/copy.png"))
+    copy_addr_but.setIcon(_copy_icon())
     button_make_naked(copy_addr_but)
     copy_addr_but.setToolTip(_("Copy {}").format(_("Address")))
-    copy_addr_but.clicked.connect(lambda ignored=None, text=info.address.to_ui_string(), copy_but=copy_addr_but:
-                                    parent.copy_to_clipboard(text=text, tooltip=_('Address copied to clipboard'), widget=copy_but) )
+    def copy_addr(ignored=None):
+        parent.copy_to_clipboard(text=addr_str, tooltip=_('Address copied to clipboard'), widget=copy_addr_but)
+    copy_addr_but.clicked.connect(copy_addr)
     grid.addWidget(copy_addr_but, 1, 2, 1, 1)
 
     # registration date label
-    reg_date_lbl = QLabel(f'<span style="white-space:nowrap; font-size:15pt;">Registration date:&nbsp;{util.format_time(info.registrationDate)}</span>')
+    reg_date_lbl = QLabel(_reg_date_html.format(date=util.format_time(info.registrationDate)))
     grid.addWidget(reg_date_lbl, 2, 1, 1, 1)
 
     # expiry date label
-    exp_date_lbl = QLabel(f'<span style="white-space:nowrap; font-size:15pt;">Expiry date:&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;{util.format_time(info.expiryDate)}</span>')
+    exp_date_lbl = QLabel(_exp_date_html.format(date=util.format_time(info.expiryDate)))
     grid.addWidget(exp_date_lbl, 3, 1, 1, 1)
 
     if not wallet.is_mine(info.address):
@@ -886,7 +1176,7 @@ def lns_detail_dialog(parent: MessageBoxMixin,  # Should be an ElectrumWindow in
     # Mined in block
     viewname_txt = _("View in LNS app")
     url = f'https://app.bch.domains/name/{info.name}'
-    view_tx_lbl = QLabel(f'<span style="white-space:nowrap; font-size:11pt;">{ismine_txt} <a href="{url}">{viewname_txt}</a></span>')
+    view_tx_lbl = QLabel(_view_html.format(ismine=ismine_txt, url=url, text=viewname_txt))
     view_tx_lbl.setToolTip(_("View in LNS app"))
     view_tx_lbl.linkActivated.connect(open_link)
     grid.addWidget(view_tx_lbl, 4, 1, 1, 1, Qt.AlignTop | Qt.AlignRight)
@@ -896,14 +1186,20 @@ def lns_detail_dialog(parent: MessageBoxMixin,  # Should be an ElectrumWindow in
     # QR
     tabs = QTabWidget()
     full_addr_str = info.address.to_full_ui_string()
-    qr_address = QRCodeWidget(full_addr_str, fixedSize=True)
+    qr_address = QLabel()
+    qr_address.setFixedSize(300, 300)
+    qr_address.setPixmap(_qr_pixmap(full_addr_str, 300))
     qr_address.setToolTip(full_addr_str)
     tabs.addTab(qr_address, _("Address"))
-    qr_ca_string = QRCodeWidget(lns_string, fixedSize=True)
+    qr_ca_string = QLabel()
+    qr_ca_string.setFixedSize(300, 300)
     qr_ca_string.setToolTip(lns_string)
     tabs.addTab(qr_ca_string, _("LNS Name"))
-    qr_address.setMinimumSize(300, 300)
-    qr_ca_string.setMinimumSize(300, 300)
+    def on_tab_changed(index):
+        # the QR code of the name is only drawn once its tab is shown
+        if tabs.widget(index) is qr_ca_string:
+            qr_ca_string.setPixmap(_qr_pixmap(lns_string, 300))
+    tabs.currentChanged.connect(on_tab_changed)
 
     grid.addWidget(tabs, 5, 0, 1, -1, Qt.AlignTop | Qt.AlignHCenter)
 
@@ -912,9 +1208,8 @@ def lns_detail_dialog(parent: MessageBoxMixin,  # Should be an ElectrumWindow in
     grid.addLayout(buttons, 6, 0, -1, -1)
 
     # make all labels allow select text & click links
-    for c in d.children():
-        if isinstance(c, QLabel):
-            c.setTextInteractionFlags(c.textInteractionFlags() | Qt.TextSelectableByMouse | Qt.LinksAccessibleByMouse)
+    for lbl in (avatar_lbl, name_lbl, addr_lbl, reg_date_lbl, exp_date_lbl, view_tx_lbl):
+        lbl.setTextInteractionFlags(lbl.textInteractionFlags() | Qt.TextSelectableByMouse | Qt.LinksAccessibleByMouse)
 
     try:
         d.exec_()
@@ -510,7 +510,7 @@ class PayToEdit(PrintError, ScanQRTextEdit):
             # the local event loop can cause this code path to execute again
             # if not careful (see the self._lns_busy flag documented inside
             # function `resolve` below).
-            res = lnsqt.verify_multiple_names(list(need_verif), self.win, wallet)
+            res = lnsqt.verify_multiple_names(need_verif, self.win, wallet)
             if res is None:
                 # user abort
                 return